@@ -24,10 +24,10 @@ def plot_commits(commits: List[str], commit_range: CommitRange, contributors: Li
     max_date = datetime.min.replace(tzinfo=timezone.utc)
 
     for commit in commits:
-        commit_obj = commit_range.commit(commit)
+        author = commit_range.author(commit)
         for contributor in contributors:
-            if contributor == commit_obj.author:
-                committed_date = commit_obj.committed_datetime
+            if contributor == author:
+                committed_date = commit_range.commit_table.committed_datetime(commit)
                 commit_data[contributor.name].append(date2num(committed_date))
                 min_date = min(min_date, committed_date)
                 max_date = max(max_date, committed_date)
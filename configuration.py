@@ -52,6 +52,7 @@ class Configuration:
         self.ignore_whitespace_changes = True
         self.ignore_remote_repo = False
         self.blame_unseen = True
+        self.line_syntax_attribution = False
         self.no_graphs = False
         self.machine_preprocessed_output = False
         self.prescan_mode = False
@@ -1,20 +1,35 @@
 '''
 File containing code for syntactic analysis of files.
 '''
+import hashlib
+import math
 import os
-from collections import defaultdict
+import pickle
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Iterable
 from pathlib import Path
 
+import numpy as np
+from git import Repo
+
 from configuration import Configuration
-from history_analyzer import Ownership
-from lib import FileGroup
+from history_analyzer import Ownership, CommitFiles, AnalysisResult, line_author
+from lib import FileGroup, Contributor, find_contributor
 from semantic_analysis import LangElement
 from semantic_weight_model import SemanticWeightModel
 from syntactic_weight_model import SyntacticWeightModel
+from uni_chars import *
+
+# Suffixes without weight map files map to None, so that they are not looked up again
+loaded_weight_maps: Dict[str, Optional['SyntacticWeightModel']] = {}
+# Configuration and files of the analyzed commit in a process of the syntax analysis process pool
+_worker_config: Optional[Configuration] = None
+_worker_commit_files: Optional[CommitFiles] = None
 
-loaded_weight_maps: Dict[str, 'SyntacticWeightModel'] = {}
+# Bump whenever the syntactic weight computation changes, older cached weights are then ignored
+SYNTACTIC_WEIGHT_CACHE_VERSION = 2
 
 
 class BlankLineHandler:
@@ -41,10 +56,14 @@ class BlankLineHandler:
 
 
 class FileWeight:
-    def __init__(self, file: Path, file_weight: float, individual_line_weights: List[float]) -> None:
+    def __init__(self, file: Path, file_weight: float, individual_line_weights: List[float],
+                 long_lines: Optional[List[int]] = None) -> None:
         self.file = file
         self.file_weight = file_weight
         self.line_weights = individual_line_weights
+        # Positions of the penalties for exceeding the maximum line length in 'line_weights',
+        # a penalty is followed by the weight of the line it belongs to
+        self.long_lines = long_lines if long_lines is not None else []
         self.weight_model: Optional[SemanticWeightModel] = None
         self.semantic_structure: Optional[LangElement] = None
 
@@ -74,24 +93,39 @@ class FileWeight:
     def num_lines(self) -> int:
         return len(self.line_weights)
 
+    def weights_per_line(self) -> np.ndarray:
+        '''
+        Weight of every line of the file as an array, penalties for long lines are added to the weight of their line.
+        '''
+        weights = np.asarray(self.line_weights, dtype=np.float64)
+        if not self.long_lines:
+            return weights
+        line_starts = np.ones(len(weights), dtype=bool)
+        line_starts[np.asarray(self.long_lines) + 1] = False
+        return np.add.reduceat(weights, np.flatnonzero(line_starts))
+
 
-def load_weight_map(file_path: Path) -> SyntacticWeightModel:
+def load_weight_map(file_path: Path) -> Optional[SyntacticWeightModel]:
     """
-    Load the syntactic weight map for a file.
+    Load the syntactic weight map for a file, the map is compiled once per suffix.
 
     :param file_path: The file to load the weight map for
+    :return: The weight map or None if there is none for the suffix of the file
     """
     suffix = file_path.suffix.lstrip('.')
     if suffix not in loaded_weight_maps:
-        ret = SyntacticWeightModel()
-        with open(os.path.join(Path(__file__).parent, "lang-syntax", suffix + ".literal.txt"), 'r') as f:
-            ret.load_literals(f)
-        with open(os.path.join(Path(__file__).parent, "lang-syntax", suffix + ".regex.txt"), 'r') as f:
-            ret.load_regex(f)
-        loaded_weight_maps[suffix] = ret
-        return ret
-    else:
-        return loaded_weight_maps[suffix]
+        weight_map = SyntacticWeightModel()
+        try:
+            with open(os.path.join(Path(__file__).parent, "lang-syntax", suffix + ".literal.txt"), 'r') as f:
+                weight_map.load_literals(f)
+            with open(os.path.join(Path(__file__).parent, "lang-syntax", suffix + ".regex.txt"), 'r') as f:
+                weight_map.load_regex(f)
+            weight_map.compile()
+            loaded_weight_maps[suffix] = weight_map
+        except Exception:
+            # Missing or malformed weight map files
+            loaded_weight_maps[suffix] = None
+    return loaded_weight_maps[suffix]
 
 
 def has_weight_map(file: Path) -> bool:
@@ -106,32 +140,192 @@ def has_weight_map(file: Path) -> bool:
     return os.path.isfile(os.path.join(Path(__file__).parent, "lang-syntax", suffix + ".json"))
 
 
-def compute_syntactic_weight(file: Path, config: Configuration) -> Optional[FileWeight]:
+def compute_syntactic_weight(file: Path, config: Configuration,
+                             commit_files: Optional[CommitFiles] = None) -> Optional[FileWeight]:
     """
     Compute the syntactic weight of a file.
 
     :param file: Full path to the file
+    :param commit_files: Read the file from this commit instead of the working tree
     :return: The weight of the file based on its contents
     """
+    if load_weight_map(file) is None:
+        return None
     try:
-        with open(file, 'r', encoding='UTF-8-SIG') as f:
+        with (commit_files.open(file, 'UTF-8-SIG') if commit_files is not None
+              else open(file, 'r', encoding='UTF-8-SIG')) as f:
             lines = f.readlines()
-            file_weight, line_weights = compute_file_weight(file, lines, config)
-            return FileWeight(file, file_weight, line_weights)
+            long_lines: List[int] = []
+            file_weight, line_weights = compute_file_weight(file, lines, config, long_lines)
+            return FileWeight(file, file_weight, line_weights, long_lines)
     except Exception:
         return None
 
 
-def compute_lines_weight(file: Path, lines: List[str], config: Configuration) -> List[float]:
+class SyntacticWeightCache:
+    '''
+    Syntactic weights of files from previous runs, stored on disk and keyed by the git blob hash of the file contents.
+    A file that did not change, or is identical to a file of another repository, is not weighted again.
+    The key also covers the weight map of the file suffix and the configuration values used for weighting.
+    Once there are more than <max_entries> weights, the least recently used ones are dropped.
+    '''
+
+    def __init__(self, cache_dir: Path, config: Configuration, max_entries: int = 100_000) -> None:
+        self.cache_file = cache_dir / "syntactic-weights.cache"
+        self.config = config
+        self.max_entries = max_entries
+        # Key -> (file weight, line weights, long lines), None for files which could not be weighted
+        self.entries: 'OrderedDict[str, Optional[Tuple[float, List[float], List[int]]]]' = OrderedDict()
+        self.hits = 0
+        self.fingerprints: Dict[str, str] = {}
+        if self.cache_file.exists():
+            try:
+                with open(self.cache_file, 'rb') as f:
+                    cached = pickle.load(f)
+                if cached['version'] == SYNTACTIC_WEIGHT_CACHE_VERSION:
+                    self.entries = cached['entries']
+            except Exception as e:
+                print(f"{WARN} Could not read syntactic weight cache {self.cache_file}, all files will be weighted.")
+                print(f"{WARN} Exception: {e}")
+
+    def fingerprint(self, file: Path) -> str:
+        '''
+        Fingerprint of everything besides the file contents which the weight of the file depends on.
+        '''
+        suffix = file.suffix.lstrip('.')
+        if suffix not in self.fingerprints:
+            digest = hashlib.sha1(f"{suffix}\0{self.config.max_line_length}\0{self.config.over_max_line_length_weight}"
+                                  f"\0{self.config.single_file_weight}".encode('utf-8'))
+            for kind in ("literal", "regex"):
+                weight_map_file = os.path.join(Path(__file__).parent, "lang-syntax", f"{suffix}.{kind}.txt")
+                if os.path.isfile(weight_map_file):
+                    with open(weight_map_file, 'rb') as f:
+                        digest.update(b'\0' + f.read())
+            self.fingerprints[suffix] = digest.hexdigest()
+        return self.fingerprints[suffix]
+
+    def key(self, file: Path, commit_files: Optional[CommitFiles] = None) -> Optional[str]:
+        '''
+        Cache key of a file, None if the file can not be read.
+
+        :param commit_files: Take the blob hash from this commit instead of hashing the file in the working tree
+        '''
+        try:
+            if commit_files is not None:
+                blob = commit_files.blobs[commit_files.relative(file)]
+            else:
+                with open(file, 'rb') as f:
+                    content = f.read()
+                # The same hash git gives the blob, files read from the working tree and from commits share the key
+                blob = hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+        except (OSError, KeyError):
+            return None
+        return f"{blob}:{self.fingerprint(file)}"
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def get(self, key: str, file: Path) -> Optional[FileWeight]:
+        self.entries.move_to_end(key)
+        self.hits += 1
+        entry = self.entries[key]
+        return FileWeight(file, entry[0], list(entry[1]), list(entry[2])) if entry is not None else None
+
+    def put(self, key: str, weight: Optional[FileWeight]) -> None:
+        self.entries[key] = (weight.file_weight, weight.line_weights, weight.long_lines) if weight is not None else None
+        self.entries.move_to_end(key)
+
+    def save(self) -> None:
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first, an interrupted run must not leave a broken cache behind
+        tmp_file = self.cache_file.with_suffix('.tmp')
+        with open(tmp_file, 'wb') as f:
+            pickle.dump({'version': SYNTACTIC_WEIGHT_CACHE_VERSION, 'entries': self.entries}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, self.cache_file)
+
+
+def compute_syntactic_weights(files: List[Path], config: Configuration, commit_files: Optional[CommitFiles] = None,
+                              jobs: int = 1, chunk_size: int = 64, cache: Optional[SyntacticWeightCache] = None) \
+        -> List[Optional[FileWeight]]:
+    """
+    Compute the syntactic weight of many files, see `compute_syntactic_weight`.
+    With more than one job, batches of consecutive files are weighted by a process pool.
+
+    :param files: Full paths to the files
+    :param commit_files: Read the files from this commit instead of the working tree
+    :param jobs: Number of processes weighting the files
+    :param chunk_size: Largest number of files sent to a process at once
+    :param cache: Weights of files with the same contents are taken from the cache, new weights are added to it
+    :return: The weight of each file in the order of 'files', None for files that could not be weighted
+    """
+    # Files without a weight map are not sent to the processes at all
+    supported = [file for file in files if load_weight_map(file) is not None]
+    weights: Dict[Path, Optional[FileWeight]] = {}
+    if cache is not None:
+        keys = {file: cache.key(file, commit_files) for file in supported}
+        for file, key in keys.items():
+            if key is not None and key in cache:
+                weights[file] = cache.get(key, file)
+        supported = [file for file in supported if file not in weights]
+
+    weights.update(_compute_syntactic_weights(supported, config, commit_files, jobs, chunk_size))
+    if cache is not None:
+        for file in supported:
+            key = keys[file]
+            if key is not None:
+                cache.put(key, weights[file])
+    return [weights.get(file) for file in files]
+
+
+def _compute_syntactic_weights(files: List[Path], config: Configuration, commit_files: Optional[CommitFiles],
+                               jobs: int, chunk_size: int) -> Dict[Path, Optional[FileWeight]]:
+    if jobs <= 1 or len(files) <= 1:
+        return {file: compute_syntactic_weight(file, config, commit_files) for file in files}
+
+    # Several chunks per process even out files of different sizes
+    chunk_size = max(1, min(chunk_size, math.ceil(len(files) / (jobs * 4))))
+    chunks = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+    samples = list({file.suffix: file for file in files}.values())
+    initargs = (samples, config, str(commit_files.repo.working_dir), commit_files.commit) \
+        if commit_files is not None else (samples, config, None, None)
+    weights: Dict[Path, Optional[FileWeight]] = {}
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_syntax_worker, initargs=initargs) as executor:
+        # Results are collected in the order of the chunks
+        for chunk, chunk_weights in zip(chunks, executor.map(_compute_chunk_weights, chunks)):
+            weights.update(zip(chunk, chunk_weights))
+    return weights
+
+
+def _init_syntax_worker(samples: Iterable[Path], config: Configuration, repo_path: Optional[str],
+                        commit: Optional[str]) -> None:
+    global _worker_config, _worker_commit_files
+    _worker_config = config
+    for sample in samples:
+        load_weight_map(sample)
+    _worker_commit_files = CommitFiles(Repo(repo_path), commit) if repo_path is not None and commit is not None \
+        else None
+
+
+def _compute_chunk_weights(files: List[Path]) -> List[Optional[FileWeight]]:
+    return [compute_syntactic_weight(file, _worker_config, _worker_commit_files) for file in files]
+
+
+def compute_lines_weight(file: Path, lines: List[str], config: Configuration,
+                         long_lines: Optional[List[int]] = None) -> List[float]:
     '''
     Compute the weight of each line in a file.
 
     :param file: The original file path
     :param lines: Content of the file 'file'
     :param config: Configuration to obtain constraints from
+    :param long_lines: Positions of the penalties for long lines in the result are appended here
     '''
     strip_chars = ' \t\r\n'
     weight_map = load_weight_map(file)
+    assert weight_map is not None, f"No weight map for {file}"
     blank_line_handler = BlankLineHandler()
     line_weights = []
     for line in lines:
@@ -141,13 +335,16 @@ def compute_lines_weight(file: Path, lines: List[str], config: Configuration) ->
             continue
         blank_line_handler.clear()
         if len(line) >= config.max_line_length:
+            if long_lines is not None:
+                long_lines.append(len(line_weights))
             line_weights.append(config.over_max_line_length_weight)
         weight = weight_map.get_weight(line, line_stripped)
         line_weights.append(weight)
     return line_weights
 
 
-def compute_file_weight(file: Path, lines: List[str], config: Configuration) -> Tuple[float, List[float]]:
+def compute_file_weight(file: Path, lines: List[str], config: Configuration,
+                        long_lines: Optional[List[int]] = None) -> Tuple[float, List[float]]:
     '''
     Compute the weight of a file. File weight is the sum of all line weights divided by the number of lines.
     The resulting ratio is then applied to the base file weight.
@@ -155,13 +352,51 @@ def compute_file_weight(file: Path, lines: List[str], config: Configuration) ->
     :param file: Full path to the file
     :param lines: Content of the file 'file'
     :param config: Configuration to obtain constraints from
+    :param long_lines: Positions of the penalties for long lines in the line weights are appended here
     '''
-    line_weights = compute_lines_weight(file, lines, config)
+    line_weights = compute_lines_weight(file, lines, config, long_lines)
     weight_sum = sum(line_weights)
     ratio = weight_sum / len(line_weights)
     return config.single_file_weight * ratio, line_weights
 
 
+def line_weight_shares(contributors: List[Contributor], local_syntax: Dict[Path, FileWeight],
+                       history_analysis: AnalysisResult) -> Dict[Path, Dict[Contributor, float]]:
+    '''
+    Split the syntactic weight of files between their contributors by the weights of the lines each of them owns.
+    The weights are summed per author with a single grouped sum per file.
+
+    :param contributors: Contributors the authors of the lines are matched to
+    :param local_syntax: Syntactic weights of the files
+    :param history_analysis: Ownership of the lines of the files
+    :return: Share of the syntactic weight of each file for each contributor owning a line of it
+    '''
+    ret: Dict[Path, Dict[Contributor, float]] = {}
+    contributor_of_author: Dict[int, Optional[Contributor]] = {}
+
+    for file, file_weight in local_syntax.items():
+        ownership = history_analysis.get(file)
+        if ownership is None:
+            continue
+        weights = file_weight.weights_per_line()
+        total_weight = weights.sum()
+        if total_weight == 0:
+            continue
+        # The lines of the ownership end with the empty line after the last line break, which has no weight
+        authors = ownership.changes.author_ids()
+        line_count = min(len(weights), len(authors))
+        owned_weights = np.bincount(authors[:line_count], weights=weights[:line_count])
+        shares: Dict[Contributor, float] = {}
+        for author_id in np.flatnonzero(owned_weights).tolist():
+            if author_id not in contributor_of_author:
+                contributor_of_author[author_id] = find_contributor(contributors, line_author(author_id))
+            contributor = contributor_of_author[author_id]
+            if contributor is not None:
+                shares[contributor] = shares.get(contributor, 0.0) + float(owned_weights[author_id] / total_weight)
+        ret[file] = shares
+    return ret
+
+
 def get_complete_files(ownerships: Dict[Path, Ownership], threshold: float) -> Dict[Path, datetime]:
     '''
     Get the files that are considered complete from a development standpoint based on the threshold.
@@ -175,18 +410,18 @@ def get_complete_files(ownerships: Dict[Path, Ownership], threshold: float) -> D
         complete_date = None
         history_len = len(ownership.history.values())
         if history_len == 1:
-            complete_date = next(iter(ownership.history.values())).content[0].change_date
+            complete_date = next(iter(ownership.history.values())).first_change_date
         else:
             for history in ownership.history.values():
-                size = sum(len(line.content) for line in history.content)
+                size = history.size
                 if prev_size is not None and prev_size > 0:
                     if abs(size - prev_size) / prev_size > threshold:
                         complete_date = None
                     elif complete_date is None:
-                        complete_date = history.content[0].change_date
+                        complete_date = history.first_change_date
                 prev_size = size
             if prev_size and prev_size <= 0 and complete_date is None:
-                complete_date = next(iter(ownership.history.values())).content[0].change_date
+                complete_date = next(iter(ownership.history.values())).first_change_date
                 # Probably a binary file
         if complete_date is not None:
             complete_files[path] = complete_date
@@ -198,28 +433,25 @@ def group_by_common_suffix(paths: List[Path]) -> Dict[str, List[Path]]:
     Group a list of paths by their common suffix.
     This does not include the file extension! Common suffix is commonly used to group related files.
     E.g. AddUserDTO.java and UpdateUserDTO.java will be grouped by 'UserDTO'.
+    A path is grouped by the longest suffix its stem shares with the stem of any other path.
 
     :param paths: List of paths to group
     '''
+    # Sorted by the reversed stems, the stem sharing the longest suffix with a stem is one of its neighbours
+    distinct = sorted(dict.fromkeys(paths), key=lambda path: path.stem[::-1])
+    reversed_stems = [path.stem[::-1] for path in distinct]
+    # Length of the common suffix of each stem and the next one in the sorted order
+    next_common = [len(os.path.commonprefix([reversed_stems[i], reversed_stems[i + 1]]))
+                   for i in range(len(distinct) - 1)]
+
+    suffix_lengths: Dict[Path, int] = {}
+    for i, path in enumerate(distinct):
+        suffix_lengths[path] = max(next_common[i - 1] if i > 0 else 0, next_common[i] if i < len(next_common) else 0)
+
     result = defaultdict(list)
-    for path1 in paths:
-        stem1 = path1.stem
-        max_common_suffix = ''
-        for path2 in paths:
-            if path1 == path2:
-                continue
-            stem2 = path2.stem
-            min_len = min(len(stem1), len(stem2))
-            common_suffix = ''
-            for i in range(min_len):
-                char = stem1[-i - 1]
-                if stem2[-i - 1] == char:
-                    common_suffix = char + common_suffix
-                else:
-                    break
-            if len(common_suffix) > len(max_common_suffix):
-                max_common_suffix = common_suffix
-        result[max_common_suffix].append(path1)
+    for path in paths:
+        length = suffix_lengths[path]
+        result[path.stem[len(path.stem) - length:]].append(path)
     return dict(result)
 
 
@@ -3,16 +3,32 @@ File containing code for Git history analysis.
 '''
 import copy
 import datetime
+import hashlib
+import io
+import os
+import pickle
+import queue
 import re
-from collections import deque, defaultdict
+import subprocess
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque, defaultdict, OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import redirect_stdout
 from datetime import timedelta
+from multiprocessing import Manager
 from pathlib import Path
-from typing import List, Dict, Tuple, Deque, Optional, DefaultDict, Set, Union
+from typing import List, Dict, Tuple, Deque, Optional, DefaultDict, Set, Union, Iterator, Iterable, Type, \
+    overload, IO, Collection
 
 from configuration import Configuration
-from lib import Percentage, first_commit, repo_p, Contributor, find_contributor, posix_repo_p
+from lib import Percentage, ContributionMatrix, IgnoreMatcher, first_commit, repo_p, Contributor, find_contributor, posix_repo_p
 
-from git import Repo, Commit, DiffIndex
+import numpy as np
+from git import Repo, Commit, DiffIndex, GitCommandError, Actor
+from git.objects.util import from_timestamp, utctz_to_altz
 
 from uni_chars import *
 
@@ -20,6 +36,11 @@ AuthorName = str
 
 AnalysisResult = Dict[Path, 'Ownership']
 
+# Changes of a commit replayed by one process of a parallel replay: commit index, hash and date, the changes
+# with their index in the commit, and the snapshot files and blamed files first changed by the commit
+ShardCommit = Tuple[int, str, datetime.datetime, List[Tuple[int, Path, 'Change']], AnalysisResult,
+                    Dict[Path, List[Tuple[AuthorName, str]]]]
+
 ROOT_HASH = '4b825dc642cb6eb9a060e54bf8d69288fbee4904'
 
 HUNK_HEADER_PATTERN: re.Pattern[str] = re.compile(
@@ -31,19 +52,74 @@ HUNK_CONFLICT_PATTERN: re.Pattern[str] = re.compile(
 CONFLICT_A_NAME: re.Pattern = re.compile(r"--- a/(.*)\s")
 CONFLICT_B_NAME: re.Pattern = re.compile(r"\+\+\+ b/(.*)\s")
 
+DIFF_GIT_HEADER_PATTERN: re.Pattern[bytes] = re.compile(rb'^diff --git ("?[ab]/.+?"?) ("?[ab]/.+?"?)$')
+QUOTED_PATH_ESCAPE_PATTERN: re.Pattern[bytes] = re.compile(rb'\\([0-7]{3}|.)')
+QUOTED_PATH_ESCAPES = {b'n': b'\n', b't': b'\t', b'r': b'\r', b'a': b'\a', b'b': b'\b', b'f': b'\f', b'v': b'\v'}
+
+# Each commit in the `git log` stream starts with a NUL byte, which can never start a diff line
+STREAM_COMMIT_MARKER = b'\0'
+STREAM_LOG_FORMAT = '%x00%H%x00%P%x00%cd%x00%an'
+
+# Characters of changes obtained ahead of the replay, after which no further commits are obtained in advance
+PIPELINE_MAX_BUFFERED_CHARS = 64 * 1024 * 1024
+# Commits whose changes may wait for each process of a parallel replay, after which obtaining changes pauses
+REPLAY_QUEUE_SIZE = 16
+
+# Bump whenever the pickled layout of `Ownership` changes, older snapshots are then ignored
+OWNERSHIP_SNAPSHOT_VERSION = 4
+
+# Marks the start of a commit in the output of `stream_commit_stats`
+STATS_COMMIT_MARKER = '\1'
+
+# Fields of every ref read in `CommitRange`, the peeled object is only set for annotated tags
+REF_FORMAT = '%(objectname)%00%(*objectname)%00%(symref)%00%(refname)'
+
+# Fields of every commit read into `CommitTable`, the message is the last field as it may span multiple lines
+COMMIT_TABLE_FORMAT = '%H%x00%P%x00%an%x00%ae%x00%cd%x00%B'
+
+# Number of resolved commits kept by `CommitRange.commit`
+COMMIT_CACHE_SIZE = 4096
+
+# Number of files whose git blame output is kept for the `Ownership.fix_file` fallback
+BLAME_CACHE_SIZE = 64
+
 
 class OwnershipHistory:
     '''
     Class representing the ownership history of a file at a given commit.
+    Only the lines replaced since the previous record of the file are stored, the whole content of the file
+    at this commit is reconstructed on demand by replaying the records of the file in order.
     '''
 
-    def __init__(self, commit: str, content: List['LineMetadata'], lines_changed: int):
+    def __init__(self, commit: str, lines_changed: int, records: List['OwnershipHistory'],
+                 start: int, removed: int, inserted: 'LineOwnership', line_count: int, size: int,
+                 first_change_date: Optional[datetime.datetime]):
         self.commit = commit
-        self.content = content
         self.lines_changed = lines_changed
+        # All records of the file in the order they were made, shared between the records
+        self.records = records
+        self.index = len(records)
+        # Lines [start, start + removed) of the previous record were replaced by <inserted>
+        self.start = start
+        self.removed = removed
+        self.inserted = inserted
+        # Summary of the content, so that it does not have to be reconstructed
+        self.line_count = line_count
+        self.size = size
+        self.first_change_date = first_change_date
+
+    @property
+    def content(self) -> 'LineOwnership':
+        '''
+        Reconstruct the ownership of the lines of the file at this commit.
+        '''
+        content = LineOwnership()
+        for record in self.records[:self.index + 1]:
+            content[record.start:record.start + record.removed] = record.inserted
+        return content
 
     def __str__(self):
-        return f"{self.commit} - Lines: {len(self.content)}"
+        return f"{self.commit} - Lines: {self.line_count}"
 
     def __repr__(self):
         return self.__str__()
@@ -74,6 +150,532 @@ class LineMetadata:
         return self.__str__()
 
 
+# Authors and change dates of lines are interned, `LineOwnership` only stores indexes into these tables
+_line_authors: List[str] = []
+_line_author_ids: Dict[str, int] = {}
+_line_dates: List[datetime.datetime] = []
+_line_date_ids: Dict[Tuple[datetime.datetime, Optional[timedelta]], int] = {}
+
+
+def line_author_id(author: AuthorName) -> int:
+    '''
+    Get the id of the author in the table of line authors, the author is added if not yet present.
+    '''
+    ret = _line_author_ids.get(author)
+    if ret is None:
+        ret = _line_author_ids[author] = len(_line_authors)
+        _line_authors.append(author)
+    return ret
+
+
+def line_author(author_id: int) -> AuthorName:
+    '''
+    Get the author with the given id from the table of line authors.
+    '''
+    return _line_authors[author_id]
+
+
+def _line_date_id(date: datetime.datetime) -> int:
+    # Equal points in time in different time zones are kept apart, so that the original date is preserved
+    key = (date, date.utcoffset())
+    ret = _line_date_ids.get(key)
+    if ret is None:
+        ret = _line_date_ids[key] = len(_line_dates)
+        _line_dates.append(date)
+    return ret
+
+
+class LineOwnership:
+    '''
+    Columnar storage of the ownership of the lines in a file.
+    Authors and change dates are stored in arrays as ids of interned values, so a line does not need its own object.
+    Behaves like a list of `LineMetadata`, the instances are created on access.
+
+    All modifications are tracked, so that the lines changed since the last call to `take_modified` are known.
+    '''
+    __slots__ = ('authors', 'dates', 'contents', 'size', '_unmodified_head', '_unmodified_tail', '_taken_len')
+
+    def __init__(self, lines: Iterable[LineMetadata] = ()) -> None:
+        self.contents: List[str] = []
+        # Number of characters in all lines
+        self.size = 0
+        # Number of lines at the start and at the end which were not modified since the last `take_modified`
+        self._unmodified_head = 0
+        self._unmodified_tail = 0
+        self._taken_len = 0
+        self._init_columns()
+        self.extend(lines)
+
+    @classmethod
+    def of(cls, author: AuthorName, date: datetime.datetime, contents: List[str]) -> 'LineOwnership':
+        '''
+        Create lines with the same author and change date.
+        '''
+        ret = cls()
+        ret._splice(0, 0, array('i', [line_author_id(author)]) * len(contents),
+                    array('i', [_line_date_id(date)]) * len(contents), contents)
+        return ret
+
+    def author_id(self, index: int) -> int:
+        '''
+        Get the id of the author of the line at <index>.
+        '''
+        return self.authors[index]
+
+    def set_author_id(self, index: int, author_id: int) -> None:
+        '''
+        Change the author of the line at <index>, the change date and content stay the same.
+        '''
+        self._splice(index, index + 1, array('i', [author_id]), self._column_slice(index, index + 1)[1],
+                     self.contents[index:index + 1])
+
+    def author_line_counts(self, start: int = 0) -> Dict[int, int]:
+        '''
+        Count the lines of each author from the line <start> onwards.
+
+        :return: Number of lines of each author id, in the order of their first line
+        '''
+        authors = np.frombuffer(self.authors, dtype=np.intc)[start:]
+        line_counts = np.bincount(authors)
+        author_ids, first_lines = np.unique(authors, return_index=True)
+        return {author_id: int(line_counts[author_id]) for author_id in author_ids[np.argsort(first_lines)].tolist()}
+
+    def author_ids(self) -> np.ndarray:
+        '''
+        Get the author id of every line as an array.
+        '''
+        return np.frombuffer(self.authors, dtype=np.intc)
+
+    def take_modified(self) -> Tuple[int, int, 'LineOwnership']:
+        '''
+        Get the lines modified since the previous call.
+
+        :return: Lines [start, start + removed) of the previous state were replaced by the returned lines
+        '''
+        start = self._unmodified_head
+        tail = min(self._unmodified_tail, len(self) - start, self._taken_len - start)
+        removed = self._taken_len - start - tail
+        inserted = self[start:len(self) - tail]
+        self._unmodified_head = self._unmodified_tail = self._taken_len = len(self)
+        return start, removed, inserted
+
+    def _init_columns(self) -> None:
+        self.authors = array('i')
+        self.dates = array('i')
+
+    def _splice_columns(self, start: int, stop: int, authors: array, dates: array) -> None:
+        self.authors[start:stop] = authors
+        self.dates[start:stop] = dates
+
+    def _column_slice(self, start: int, stop: int) -> Tuple[array, array]:
+        return self.authors[start:stop], self.dates[start:stop]
+
+    def _line(self, index: int) -> LineMetadata:
+        return LineMetadata(_line_authors[self.authors[index]], self.contents[index], _line_dates[self.dates[index]])
+
+    def _insert_index(self, index: int) -> int:
+        # Same semantics as `list.insert`
+        if index < 0:
+            index = max(index + len(self), 0)
+        return min(index, len(self))
+
+    def _splice(self, start: int, stop: int, authors: array, dates: array, contents: List[str]) -> None:
+        self._unmodified_head = min(self._unmodified_head, start)
+        self._unmodified_tail = min(self._unmodified_tail, len(self) - stop)
+        self.size += sum(map(len, contents)) - sum(map(len, self.contents[start:stop]))
+        # Columns are modified first, they may rely on the previous number of lines
+        self._splice_columns(start, stop, authors, dates)
+        self.contents[start:stop] = contents
+
+    def _columns(self, lines: Iterable[LineMetadata]) -> Tuple[array, array, List[str]]:
+        if isinstance(lines, LineOwnership):
+            return (*lines._column_slice(0, len(lines)), lines.contents)
+        lines = list(lines)
+        return (array('i', [line_author_id(line.author) for line in lines]),
+                array('i', [_line_date_id(line.change_date) for line in lines]),
+                [line.content for line in lines])
+
+    def _range(self, index: slice) -> Tuple[int, int]:
+        start, stop, step = index.indices(len(self))
+        if step != 1:
+            raise ValueError("Only contiguous slices of lines are supported")
+        return start, max(start, stop)
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+    def __iter__(self) -> Iterator[LineMetadata]:
+        for i in range(len(self)):
+            yield self._line(i)
+
+    @overload
+    def __getitem__(self, index: int) -> LineMetadata: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> 'LineOwnership': ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop = self._range(index)
+            ret = type(self)()
+            ret._splice(0, 0, *self._column_slice(start, stop), self.contents[start:stop])
+            return ret
+        return self._line(range(len(self))[index])
+
+    def __setitem__(self, index: Union[int, slice], value) -> None:
+        if isinstance(index, slice):
+            start, stop = self._range(index)
+        else:
+            start = range(len(self))[index]
+            stop = start + 1
+            value = [value]
+        self._splice(start, stop, *self._columns(value))
+
+    def __delitem__(self, index: Union[int, slice]) -> None:
+        self[index if isinstance(index, slice) else slice(index, range(len(self))[index] + 1)] = []
+
+    def insert(self, index: int, line: LineMetadata) -> None:
+        index = self._insert_index(index)
+        self[index:index] = [line]
+
+    def pop(self, index: int = -1) -> LineMetadata:
+        ret = self[index]
+        del self[index]
+        return ret
+
+    def append(self, line: LineMetadata) -> None:
+        self.insert(len(self), line)
+
+    def extend(self, lines: Iterable[LineMetadata]) -> None:
+        self[len(self):] = lines
+
+    def clear(self) -> None:
+        del self[:]
+
+    def _values(self) -> Tuple[List[AuthorName], List[datetime.datetime]]:
+        authors, dates = self._column_slice(0, len(self))
+        return [_line_authors[x] for x in authors], [_line_dates[x] for x in dates]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, LineOwnership):
+            return self.contents == other.contents and self._values() == other._values()
+        return NotImplemented
+
+    def __getstate__(self):
+        # Ids are only valid in the current process, the interned values are stored instead
+        return (*self._values(), self.contents, self._unmodified_head, self._unmodified_tail, self._taken_len)
+
+    def __setstate__(self, state) -> None:
+        authors, dates, contents, unmodified_head, unmodified_tail, taken_len = state
+        LineOwnership.__init__(self)
+        self._splice(0, 0, array('i', map(line_author_id, authors)), array('i', map(_line_date_id, dates)), contents)
+        self._unmodified_head, self._unmodified_tail, self._taken_len = unmodified_head, unmodified_tail, taken_len
+
+    def __str__(self):
+        return str(list(self))
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class RunLengthLineOwnership(LineOwnership):
+    '''
+    Line ownership storing authors and change dates as runs of consecutive lines with the same author and date.
+    Suited for large files, e.g. generated or vendored ones, where long sections of lines share their author.
+    A line is located with a binary search over the starts of the runs, lines per author come from run lengths.
+    '''
+    __slots__ = ('run_starts', 'run_authors', 'run_dates')
+
+    def _init_columns(self) -> None:
+        self.run_starts: List[int] = []
+        self.run_authors = array('i')
+        self.run_dates = array('i')
+
+    def _run(self, index: int) -> int:
+        return bisect_right(self.run_starts, index) - 1
+
+    def _run_end(self, run: int) -> int:
+        return self.run_starts[run + 1] if run + 1 < len(self.run_starts) else len(self.contents)
+
+    def _split_run(self, index: int) -> int:
+        # Make sure a run starts at <index>, returns the position of the run
+        run = bisect_left(self.run_starts, index)
+        if run < len(self.run_starts) and self.run_starts[run] == index or index >= len(self.contents):
+            return run
+        self.run_starts.insert(run, index)
+        self.run_authors.insert(run, self.run_authors[run - 1])
+        self.run_dates.insert(run, self.run_dates[run - 1])
+        return run
+
+    def _merge_runs(self, run: int) -> None:
+        # Merge the run with the previous one if they have the same author and date
+        if 0 < run < len(self.run_starts) and self.run_authors[run] == self.run_authors[run - 1] and \
+                self.run_dates[run] == self.run_dates[run - 1]:
+            del self.run_starts[run]
+            del self.run_authors[run]
+            del self.run_dates[run]
+
+    def _splice_columns(self, start: int, stop: int, authors: array, dates: array) -> None:
+        first = self._split_run(start)
+        last = self._split_run(stop)
+
+        new_starts: List[int] = []
+        new_authors = array('i')
+        new_dates = array('i')
+        for i in range(len(authors)):
+            if not new_starts or authors[i] != new_authors[-1] or dates[i] != new_dates[-1]:
+                new_starts.append(start + i)
+                new_authors.append(authors[i])
+                new_dates.append(dates[i])
+
+        shift = len(authors) - (stop - start)
+        self.run_starts[first:] = new_starts + [x + shift for x in self.run_starts[last:]]
+        self.run_authors[first:last] = new_authors
+        self.run_dates[first:last] = new_dates
+        self._merge_runs(first + len(new_starts))
+        self._merge_runs(first)
+
+    def _column_slice(self, start: int, stop: int) -> Tuple[array, array]:
+        authors = array('i')
+        dates = array('i')
+        run = self._run(start)
+        while start < stop:
+            end = min(self._run_end(run), stop)
+            authors.extend(array('i', [self.run_authors[run]]) * (end - start))
+            dates.extend(array('i', [self.run_dates[run]]) * (end - start))
+            start = end
+            run += 1
+        return authors, dates
+
+    def _line(self, index: int) -> LineMetadata:
+        run = self._run(index)
+        return LineMetadata(_line_authors[self.run_authors[run]], self.contents[index],
+                            _line_dates[self.run_dates[run]])
+
+    def author_id(self, index: int) -> int:
+        return self.run_authors[self._run(range(len(self))[index])]
+
+    def author_ids(self) -> np.ndarray:
+        run_lengths = np.diff(np.array([*self.run_starts, len(self.contents)], dtype=np.intp))
+        return np.repeat(np.frombuffer(self.run_authors, dtype=np.intc), run_lengths)
+
+    def author_line_counts(self, start: int = 0) -> Dict[int, int]:
+        ret: Dict[int, int] = {}
+        for run in range(max(self._run(start), 0), len(self.run_starts)):
+            run_start = max(self.run_starts[run], start)
+            if run_start < self._run_end(run):
+                author_id = self.run_authors[run]
+                ret[author_id] = ret.get(author_id, 0) + self._run_end(run) - run_start
+        return ret
+
+
+class GitObjectReader:
+    '''
+    Reads objects of a repository through long-lived `git cat-file --batch` and `git cat-file --batch-check`
+    processes, so that reading many blobs does not start a new git process for each of them.
+    The processes are started on first use.
+    '''
+
+    def __init__(self, repo: Repo) -> None:
+        self.repo = repo
+        self._processes: Dict[str, subprocess.Popen] = {}
+        self._lock = threading.Lock()
+
+    def read(self, rev: str) -> bytes:
+        '''
+        Read the content of an object, e.g. a blob given by its hash or by `<commit>:<path>`.
+        '''
+        with self._lock:
+            process, size = self._request('--batch', rev)
+            assert process.stdout is not None
+            content = process.stdout.read(size)
+            # Each object is followed by a newline
+            process.stdout.read(1)
+            return content
+
+    def size(self, rev: str) -> int:
+        '''
+        Obtain the size of an object in bytes without reading its content.
+        '''
+        with self._lock:
+            return self._request('--batch-check', rev)[1]
+
+    def _request(self, mode: str, rev: str) -> Tuple[subprocess.Popen, int]:
+        process = self._processes.get(mode)
+        if process is None or process.poll() is not None:
+            process = self._processes[mode] = subprocess.Popen(['git', 'cat-file', mode], cwd=self.repo.working_dir,
+                                                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        assert process.stdin is not None and process.stdout is not None
+        process.stdin.write(rev.encode('utf-8') + b'\n')
+        process.stdin.flush()
+        header = process.stdout.readline().decode('utf-8', 'replace').split()
+        # "<sha> <type> <size>", or "<rev> missing" if the object does not exist
+        if len(header) != 3:
+            raise ValueError(f"Object {rev} does not exist in {self.repo.working_dir}: {' '.join(header)}")
+        return process, int(header[2])
+
+    def close(self) -> None:
+        '''
+        Stop the `git cat-file` processes.
+        '''
+        for process in self._processes.values():
+            if process.stdin is not None:
+                process.stdin.close()
+            process.wait()
+        self._processes.clear()
+
+    def __del__(self) -> None:
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class CommitFiles:
+    '''
+    Files of a commit read from the object database instead of the working tree.
+    Any commit can be analyzed without a checkout, a bare repository included, and several analyses can share a clone.
+    The files keep the paths they would have in the working tree.
+    '''
+
+    def __init__(self, repo: Repo, commit: str, objects: Optional[GitObjectReader] = None) -> None:
+        self.repo = repo
+        self.commit = commit
+        self.objects = objects if objects is not None else GitObjectReader(repo)
+        self.root = Path(str(repo.working_dir))
+        # Repository relative path -> blob hash, submodules and symbolic links have no content to analyze
+        self.blobs: Dict[str, str] = {}
+        lstree = repo.git.execute(['git', 'ls-tree', '-r', '-z', '--full-tree', commit])
+        assert isinstance(lstree, str)
+        for entry in lstree.split('\0'):
+            info, _, file_name = entry.partition('\t')
+            if not file_name:
+                continue
+            mode, object_type, sha = info.split()
+            if object_type == 'blob' and mode != '120000':
+                self.blobs[file_name] = sha
+
+    def relative(self, file: Path) -> str:
+        return Path(os.path.relpath(file, self.root)).as_posix()
+
+    def __contains__(self, file: Path) -> bool:
+        return self.relative(file) in self.blobs
+
+    def read(self, file: Path) -> bytes:
+        '''
+        Content of a file given by its working tree path.
+
+        :raises KeyError: If the file is not part of the commit
+        '''
+        return self.objects.read(self.blobs[self.relative(file)])
+
+    def open(self, file: Path, encoding: str = 'utf-8') -> IO[str]:
+        '''
+        Text stream of a file given by its working tree path, decoded the same way `open()` decodes files.
+        '''
+        return io.TextIOWrapper(io.BytesIO(self.read(file)), encoding=encoding)
+
+    def materialize(self, files: Iterable[Path], directory: Path) -> Dict[Path, Path]:
+        '''
+        Write files into <directory> for tools which only accept paths, the repository layout is kept.
+
+        :return: Mapping of the written files to the working tree paths they stand for
+        '''
+        ret: Dict[Path, Path] = {}
+        for file in files:
+            target = directory / self.relative(file)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(self.read(file))
+            ret[target] = file
+        return ret
+
+
+class CommitTable:
+    '''
+    Metadata of all commits of the repository, read by a single `git log` call.
+    The metadata is kept in parallel columns, `index` maps a commit hash to its position in the columns.
+    Commits are in the order of `git log --all`.
+    '''
+
+    def __init__(self, repo: Repo):
+        output = repo.git.execute(['git', 'log', '--all', '-z', '--date=raw', f'--format={COMMIT_TABLE_FORMAT}'])
+        assert isinstance(output, str)
+        fields = output.split('\0')
+        # The last commit may be followed by a separator as well
+        del fields[len(fields) - len(fields) % 6:]
+        self.hexshas: List[str] = fields[0::6]
+        self.parents: List[Tuple[str, ...]] = [tuple(parents.split()) for parents in fields[1::6]]
+        self.author_names: List[str] = fields[2::6]
+        self.author_emails: List[str] = fields[3::6]
+        self.committed_dates = array('q')
+        self.committer_tz_offsets = array('i')
+        for date in fields[4::6]:
+            timestamp, tz = date.split()
+            self.committed_dates.append(int(timestamp))
+            self.committer_tz_offsets.append(utctz_to_altz(tz))
+        # First line of the message, the same as `Commit.message.splitlines()[0]`
+        self.summaries: List[str] = [(message.splitlines() or [''])[0] for message in fields[5::6]]
+        self.index: Dict[str, int] = {commit_hash: i for i, commit_hash in enumerate(self.hexshas)}
+        self._children: Optional[Dict[str, List[str]]] = None
+
+    def __len__(self) -> int:
+        return len(self.hexshas)
+
+    def __contains__(self, commit_hash: object) -> bool:
+        return commit_hash in self.index
+
+    def children(self, commit_hash: str) -> List[str]:
+        '''
+        Commits having <commit_hash> as one of their parents, in the order of `git log --all`.
+        The index of children is built from the parents on first use.
+        '''
+        if self._children is None:
+            self._children = defaultdict(list)
+            for child, parents in zip(self.hexshas, self.parents):
+                for parent in parents:
+                    self._children[parent].append(child)
+        return self._children.get(commit_hash, [])
+
+    def author(self, commit_hash: str) -> Actor:
+        i = self.index[commit_hash]
+        return Actor(self.author_names[i], self.author_emails[i])
+
+    def committed_date(self, commit_hash: str) -> int:
+        return self.committed_dates[self.index[commit_hash]]
+
+    def committed_datetime(self, commit_hash: str) -> datetime.datetime:
+        i = self.index[commit_hash]
+        return from_timestamp(self.committed_dates[i], self.committer_tz_offsets[i])
+
+    def summary(self, commit_hash: str) -> str:
+        return self.summaries[self.index[commit_hash]]
+
+    def ancestors(self, commit_hash: str) -> List[str]:
+        '''
+        All commits reachable from <commit_hash>, including itself, in the order of `git log --all`.
+        '''
+        reachable = {commit_hash}
+        stack = [commit_hash]
+        while stack:
+            for parent in self.parents[self.index[stack.pop()]]:
+                if parent not in reachable:
+                    reachable.add(parent)
+                    stack.append(parent)
+        return [x for x in self.hexshas if x in reachable]
+
+
+class CommitStats:
+    '''
+    Lines inserted and deleted by a commit and the files it added, renamed, deleted or modified.
+    The commit is compared to its first parent, the same as `Commit.stats` and `Commit.diff` do.
+    '''
+
+    def __init__(self) -> None:
+        self.insertions = 0
+        self.deletions = 0
+        self.flags: Dict[str, List[Path]] = {"A": [], "R": [], "D": [], "M": []}
+
+
 class CommitRange:
     '''
     Class representing a range of commits.
@@ -85,44 +687,54 @@ class CommitRange:
         self.head = head
         self.hist = hist
         self.ownership_overrides: Dict[str, str] = {}
+        # Storage of the ownership of lines in analyzed files, `RunLengthLineOwnership` suits very large files
+        self.line_ownership: Type[LineOwnership] = LineOwnership
         if repo is None:
             raise ValueError(f"{ERROR} No repository set! Did you evaluate all code blocks above?")
         else:
             self.repo = repo
+        self.objects = GitObjectReader(self.repo)
+        # Blame of the files that existed before the first analyzed commit, taken when the file is first changed
+        self.unseen_blames: Dict[Path, List[Tuple[AuthorName, str]]] = {}
+        # Paths matching the ignore list are skipped when the diffs are parsed, set by `analyze`
+        self.ignore: Optional[IgnoreMatcher] = None
+        # Path from <hist> to <head> and the position of every commit on it, computed on first use
+        self._path: Optional[List[str]] = None
+        self._path_index: Dict[str, int] = {}
+        self._commits: 'OrderedDict[str, Commit]' = OrderedDict()
+        # Output of git blame for `Ownership.fix_file` keyed by (commit hash, repository relative path),
+        # oldest entries are evicted first
+        self.blame_results: Dict[Tuple[str, str], List[Tuple[AuthorName, str]]] = {}
+        self._commit_table: Optional[CommitTable] = None
+        self._commit_stats: Optional[Dict[str, CommitStats]] = None
 
         if self.head.lower() == 'head':
             self.head = self.repo.head.commit.hexsha
         if self.hist.lower() == 'root':
             self.hist = first_commit(self.repo.commit(self.head)).hexsha
-        marks = self.repo.git.execute(["git", "show-ref", "--heads", "--tags"])
-        remote_marks = self.repo.git.execute(['git', 'branch', '-r'])
-        assert isinstance(marks, str) and isinstance(remote_marks, str)
-
-        remote_marked_commits = [y.split() for y in remote_marks.splitlines() if len(y.split()) == 1]
-
-        merged_marked_commits = [y.split() for y in marks.splitlines()]
-
-        to_remove = []
-
-        for x in merged_marked_commits:
-            if x[1].startswith('refs/tags'):
-                resolved = self.repo.git.execute(['git', 'rev-list', '-n', '1', x[1]])
-                assert isinstance(resolved, str)
-                idx = list(map(lambda x: x[0], merged_marked_commits)).index(resolved)
-                merged_marked_commits[idx][1] = merged_marked_commits[idx][1] + ' ' + x[1]
-                to_remove.append(x)
-
-        for x in to_remove:
-            merged_marked_commits.remove(x)
-
-        marker_list = [(str(x[0]), str(x[1]).replace('refs/heads/', '').replace('refs/tags/', ''))
-                       for x in merged_marked_commits]
-
-        for name in remote_marked_commits:
-            marker_list.append((self.repo.git.execute(['git', 'rev-parse', name[0]]), name[0]))
-
+        refs = self.repo.git.execute(['git', 'for-each-ref', f'--format={REF_FORMAT}',
+                                      'refs/heads', 'refs/tags', 'refs/remotes'])
+        assert isinstance(refs, str)
+
+        heads: Dict[str, List[str]] = defaultdict(list)
+        tags: Dict[str, List[str]] = defaultdict(list)
+        remotes: List[Tuple[str, str]] = []
+        for ref in refs.splitlines():
+            sha, peeled_sha, symref, name = ref.split('\0')
+            if name.startswith('refs/heads/'):
+                heads[sha].append(name[len('refs/heads/'):])
+            elif name.startswith('refs/tags/'):
+                # Annotated tags point to a tag object, the commit is the peeled object
+                tags[peeled_sha or sha].append(name[len('refs/tags/'):])
+            elif not symref:
+                # Same as `git branch -r`, without the 'origin/HEAD -> origin/main' entries
+                remotes.append((sha, name[len('refs/remotes/'):]))
+
+        # Tags are only shown along with the branch pointing to the same commit
         self.marked_commits = dict()
-        for sha, name in marker_list:
+        for sha, names in heads.items():
+            self.marked_commits[sha] = ' '.join([names[-1], *tags[sha]])
+        for sha, name in remotes:
             self.marked_commits[sha] = name
 
         for mk in self.marked_commits.items():
@@ -140,31 +752,90 @@ class CommitRange:
             print(f" - Initial commit on: {self.hist_commit.committed_datetime}")
 
     def commit(self, commit_hash: str) -> Commit:
-        orig_commit = self.repo.commit(commit_hash)
+        '''
+        Resolve a commit, the most recently used `COMMIT_CACHE_SIZE` commits are kept.
+        '''
+        orig_commit = self._commits.get(commit_hash)
+        if orig_commit is None:
+            orig_commit = self.repo.commit(commit_hash)
+            if len(self._commits) >= COMMIT_CACHE_SIZE:
+                self._commits.popitem(last=False)
+            self._commits[commit_hash] = orig_commit
+        else:
+            self._commits.move_to_end(commit_hash)
         if commit_hash in self.ownership_overrides:
             orig_commit.author.name = self.ownership_overrides[commit_hash]
             orig_commit.author.email = f'<OVERRIDEN>{orig_commit.author.name}</OVERRIDEN>'
         return orig_commit
 
-    def __iter__(self):
-        for commit in self.compute_path():
-            yield commit
+    @property
+    def commit_table(self) -> CommitTable:
+        '''
+        Metadata of all commits in the repository, read once on first use.
+        '''
+        if self._commit_table is None:
+            self._commit_table = CommitTable(self.repo)
+        return self._commit_table
+
+    @property
+    def commit_stats(self) -> Dict[str, CommitStats]:
+        '''
+        Inserted and deleted lines and changed files of every commit in the range, read once on first use.
+        '''
+        if self._commit_stats is None:
+            self._commit_stats = dict(stream_commit_stats(self, self))
+        return self._commit_stats
+
+    def author(self, commit_hash: str) -> Actor:
+        '''
+        The author of a commit, the same as `commit(commit_hash).author` without resolving the commit.
+        '''
+        if commit_hash in self.ownership_overrides:
+            name = self.ownership_overrides[commit_hash]
+            return Actor(name, f'<OVERRIDEN>{name}</OVERRIDEN>')
+        return self.commit_table.author(commit_hash)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._materialize_path())
+
+    def __len__(self) -> int:
+        return len(self._materialize_path())
+
+    def __contains__(self, commit_hash: object) -> bool:
+        self._materialize_path()
+        return commit_hash in self._path_index
+
+    def index(self, commit_hash: str) -> int:
+        '''
+        Position of the commit on the path, <hist> is at 0.
+
+        :raises ValueError: If the commit is not on the path
+        '''
+        self._materialize_path()
+        if commit_hash not in self._path_index:
+            raise ValueError(f"{commit_hash} is not in the commit range")
+        return self._path_index[commit_hash]
+
+    def _materialize_path(self) -> List[str]:
+        if self._path is None:
+            c_range = f"{self.head}...{self.hist}"
+            args = ["--topo-order", "--ancestry-path", "--reverse"]
+            # if not include_merge_commits:
+            #     args.append("--no-merges")
+            output = self.repo.git.execute(["git", "rev-list", *args, c_range])
+            assert isinstance(output, str)
+            self._path = [self.hist, *output.splitlines()]
+            self._path_index = {commit_hash: i for i, commit_hash in enumerate(self._path)}
+        return self._path
 
     def compute_path(self, include_merge_commits=False) -> Deque[str]:
         """
         Compute the path from <current_commit_hash> to <historical_commit_hash> in the <repo>
+        The path is computed once, later calls return a copy of it.
 
         :return: A list of commit hashes sorted from <current_commit_hash> to <historical_commit_hash>
         """
-        c_range = f"{self.head}...{self.hist}"
-        args = ["--topo-order", "--ancestry-path", "--reverse"]
-        # if not include_merge_commits:
-        #     args.append("--no-merges")
-        output = self.repo.git.execute(["git", "rev-list", *args, c_range])
-        assert isinstance(output, str)
-        ret = deque(output.splitlines())
-        ret.insert(0, self.hist)
-        return ret
+        return deque(self._materialize_path())
 
     def checkout_file_from(self, commit_hash: str, file_name: str) -> str:
         """
@@ -173,9 +844,9 @@ class CommitRange:
         :param commit_hash: The hash of the commit to checkout the file from
         :param file_name: The name of the file to checkout (relative to the repository root)
         """
-        result = self.repo.git.execute(['git', 'show', f'{commit_hash}:{str(file_name)}'])
-        assert isinstance(result, str)
-        return result
+        result = self.objects.read(f'{commit_hash}:{str(file_name)}').decode('utf-8', 'surrogateescape')
+        # Same as the output of `git show`, which used to be used here
+        return result[:-1] if result.endswith('\n') else result
 
     def populate_previously_unseen_file(self, config: Optional[Configuration], change: 'Change', commit_hash: str,
                                         file_name: Path,
@@ -184,104 +855,128 @@ class CommitRange:
         Populate a previously unseen file with the content of the file at the previous commit.
         This situation can happen when the analysis starts from a commit that is not the first commit in the repository.
         '''
+        blamed_lines = self.unseen_blames.pop(change.previous_name or file_name, None)
+        if blamed_lines is not None:
+            # Blamed in bulk before the replay started
+            ret[file_name] = Ownership(file_name, 0, '', commit_date, commit_hash, '?', self.line_ownership)
+            ret[file_name].assign_blame(blamed_lines, commit_date)
+            ret[file_name].apply_change(change.hunks, commit_hash, self.repo, change.author, commit_date,
+                                        self.blame_results)
+            return
         file_path = posix_repo_p(str(file_name), self.repo)
         # Obtain the previous version of the file as a base
         content = self.checkout_file_from(commit_hash, file_path)
         ret[file_name] = Ownership(file_name, len(content.splitlines(keepends=True)),
-                                   content, commit_date, commit_hash, '?')
+                                   content, commit_date, commit_hash, '?', self.line_ownership)
         if config is not None and config.blame_unseen:
-            ret[file_name].fix_file(self.repo, commit_hash, commit_date)
-        ret[file_name].apply_change(change.hunks, commit_hash, self.repo, change.author, commit_date)
+            ret[file_name].fix_file(self.repo, commit_hash, commit_date, self.blame_results)
+        ret[file_name].apply_change(change.hunks, commit_hash, self.repo, change.author, commit_date,
+                                    self.blame_results)
 
-    def analyze(self, config: Optional[Configuration] = None, verbose=False) -> AnalysisResult:
+    def blame_unseen_files(self, workers: int) -> Dict[Path, List[Tuple[AuthorName, str]]]:
+        '''
+        Blame every file that existed before the first analyzed commit, that is at the first parent of <hist>.
+        The files are blamed by a pool of threads, each running its own `git blame` process.
+        Files that cannot be blamed are left out, they are handled once they are changed.
+        '''
+        if not self.hist_commit.parents:
+            return {}
+        parent = self.hist_commit.parents[0].hexsha
+        lstree = self.repo.git.execute(['git', 'ls-tree', '-r', '-z', parent])
+        assert isinstance(lstree, str)
+        files = []
+        for entry in lstree.split('\0'):
+            info, _, file_name = entry.partition('\t')
+            if file_name and info.split()[1] == 'blob' and not self.is_ignored(file_name):
+                files.append(file_name)
+
+        repo_path = str(self.repo.working_dir)
+
+        def blame(file_name: str) -> Optional[List[Tuple[AuthorName, str]]]:
+            try:
+                return blame_file(repo_path, parent, file_name)
+            except subprocess.CalledProcessError:
+                return None
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            blames = list(executor.map(blame, files))
+        return {repo_p(file_name, self.repo): blamed_lines
+                for file_name, blamed_lines in zip(files, blames) if blamed_lines is not None}
+
+    def is_ignored(self, file_name: str) -> bool:
+        '''
+        Whether the repository relative path matches the ignore list of the analysis.
+        '''
+        return self.ignore is not None and self.ignore.matches(file_name)
+
+    def analyze(self, config: Optional[Configuration] = None, verbose=False, streaming=False,
+                cache_dir: Optional[Path] = None, jobs: int = 1, pipeline_depth: int = 0,
+                pipeline_workers: int = 4, blame_workers: int = 8,
+                ignore: Optional[IgnoreMatcher] = None) -> AnalysisResult:
         """
         Analyze the repository, providing a list of files and their ownership.
+
+        :param streaming: Read all diffs from a single `git log` process instead of diffing each commit separately
+        :param cache_dir: Directory holding ownership snapshots of previous runs, only commits that were not analyzed
+                          by the previous run are replayed on top of the snapshot
+        :param jobs: Number of processes replaying the changes, files linked by renames are replayed by the same process
+        :param pipeline_depth: Number of commits whose changes may be obtained ahead of the replay, 0 disables it
+        :param pipeline_workers: Number of threads obtaining the changes ahead of the replay
+        :param blame_workers: Number of threads blaming the files existing before <hist> when `config.blame_unseen`
+                              is set and the analysis does not start from the first commit
+        :param ignore: Files matching the ignore list are left out of the analysis, their diffs are not even parsed
         """
+        self.ignore = ignore
         path = self.compute_path()
 
         ret: Dict[Path, Ownership] = {}
+        analyzed_commits: List[str] = []
+
+        if cache_dir is not None:
+            snapshot = load_ownership_snapshot(self, cache_dir, config)
+            if snapshot is not None:
+                analyzed_commits, ret = snapshot
+                already_analyzed = set(analyzed_commits)
+                path = deque(commit for commit in path if commit not in already_analyzed)
+                print(f"{INFO} Loaded ownership snapshot of {len(ret)} files, "
+                      f"{len(path)} new commits will be analyzed.")
+
+        if config is not None and config.blame_unseen and path and path[0] == self.hist:
+            self.unseen_blames = self.blame_unseen_files(blame_workers)
+            if verbose and self.unseen_blames:
+                print(f"{INFO} Blamed {len(self.unseen_blames)} files existing before the first analyzed commit.")
+
+        if not path:
+            commit_changes: Iterator[Tuple[str, datetime.datetime, Dict[Path, Change]]] = iter(())
+        elif streaming:
+            commit_changes = stream_file_changes(self, path, self.repo)
+        elif pipeline_depth > 0:
+            commit_changes = self._iter_file_changes_pipelined(path, pipeline_depth, pipeline_workers)
+        else:
+            commit_changes = self._iter_file_changes(path)
 
-        index = 1
-        for commit_hash in path:
-            if verbose:
-                print(f"{INFO} Analyzing commit {commit_hash} ({index}/{len(path)})")
-                index += 1
-            commit_date = self.commit(commit_hash).committed_datetime
-            file_ownership = get_file_changes(self, commit_hash, self.repo)
-            for file_name, change in file_ownership.items():
-                if file_name not in ret:
-                    if change.hunks and change.hunks[0].mode == 'R':
-                        assert change.previous_name is not None
-                        if change.previous_name in ret:
-                            ret[file_name] = ret[change.previous_name]
-                            ret[file_name].file = file_name
-                            del ret[change.previous_name]
-                        else:
-                            self.populate_previously_unseen_file(config, change, commit_hash, file_name, ret,
-                                                                 commit_date)
-                        ret[file_name].apply_change(change.hunks, commit_hash, self.repo, change.author, commit_date)
-                    elif change.hunks and change.hunks[0].mode == 'A':
-                        ret[file_name] = Ownership(file_name, change.hunks[0].change_end, change.hunks[0].content,
-                                                   commit_date, commit_hash, change.author)
-                    elif not change.hunks and change.previous_name is not None:
-                        # Just a pure rename no other changes
-                        if change.previous_name in ret:
-                            ret[file_name] = ret[change.previous_name]
-                            ret[file_name].file = file_name
-                            del ret[change.previous_name]
-                        else:
-                            self.populate_previously_unseen_file(config, change, commit_hash, file_name, ret,
-                                                                 commit_date)
-                    elif not change.hunks:
-                        # This is a binary file or empty file
-                        ret[file_name] = Ownership(file_name, -1, '', commit_date, commit_hash, change.author)
-                    elif change.hunks[0].mode == 'M':
-                        # This file already existed in the repo, this can occur if the analysis does not
-                        # start from the first commit
-                        self.populate_previously_unseen_file(config, change, commit_hash, file_name, ret, commit_date)
-                    continue
-
-                elif file_name in ret and change.hunks and change.hunks[0].mode == 'A' and not ret[file_name].exists:
-                    # This file was deleted in a previous commit and re-added in this commit
-                    ret[file_name].exists = True
-                    hunk = change.hunks[0]
-                    split = hunk.content.splitlines(keepends=True)
-                    Ownership.fix_length(hunk, split)
-
-                    for l in range(1, hunk.new_len + 1):
-                        content_index = hunk.change_start - 1 + hunk.new_len - l
-                        text = split[content_index]
-                        ret[file_name].changes.insert(hunk.prev_start, LineMetadata(change.author, text, commit_date))
-                    ret[file_name].line_count = hunk.new_len
-                    ret[file_name].history[commit_hash] = OwnershipHistory(commit_hash, ret[file_name].changes,
-                                                                           change.hunks[0].change_end)
-                    continue
-
-                elif file_name in ret and change.hunks and change.hunks[0].mode == 'D':
-                    ret[file_name].delete(commit_hash)
-                    continue
-
-                if len(change.hunks) == 1 and change.hunks[0].mode == 'D':
-                    continue
+        if jobs > 1:
+            ret = self._replay_in_parallel(config, path, commit_changes, ret, jobs, verbose)
+        else:
+            index = 1
+            for commit_hash, commit_date, file_ownership in commit_changes:
+                if verbose:
+                    print(f"{INFO} Analyzing commit {commit_hash} ({index}/{len(path)})")
+                    index += 1
+                self._apply_file_changes(config, commit_hash, commit_date, file_ownership, ret, verbose)
 
-                if len(change.hunks) == 1 and change.hunks[0].mode == 'A':
-                    # This file was added in a previous commit as well as in this commit
-                    # Likely a conflict down the line
-                    if verbose:
-                        print(f"{WARN} File {file_name} was added in a previous commit as well as in this commit.")
-                        print(f"{INFO} Replacing... (This may lead to a loss of information)")
-                        print(f"{INFO} One cause for this is Windows NTFS being case insensitive. "
-                              f"Or a merge conflict will happen.")
-                        ret[file_name] = Ownership(file_name, change.hunks[0].change_end, change.hunks[0].content,
-                                                   commit_date, commit_hash, change.author)
-                        print()
-                    continue
+        self.unseen_blames = {}
 
-                ret[file_name].apply_change(change.hunks, commit_hash, self.repo, change.author, commit_date)
+        if cache_dir is not None:
+            store_ownership_snapshot(self, cache_dir, config, [*analyzed_commits, *path], ret)
 
         if verbose:
             print()
             print(f"{SUCCESS} Analyzed {len(ret)} files.")
+            blame_fallbacks = sum(ownership.blame_fallbacks for ownership in ret.values())
+            if blame_fallbacks:
+                print(f"{WARN} Changes did not match the replayed files {blame_fallbacks} times, "
+                      f"the files were fixed using git blame.")
 
         lstree = self.repo.git.execute(['git', 'ls-tree', '-r', self.head, '--name-only'])
         assert isinstance(lstree, str)
@@ -294,6 +989,239 @@ class CommitRange:
 
         return ret
 
+    def _replay_in_parallel(self, config: Optional[Configuration], path: Collection[str],
+                            commit_changes: Iterable[Tuple[str, datetime.datetime, Dict[Path, 'Change']]],
+                            ret: AnalysisResult, jobs: int, verbose=False) -> AnalysisResult:
+        '''
+        Replay the changes of all commits in a pool of processes.
+        Files are split into lineages, a lineage is a set of paths connected by renames. Every lineage is replayed
+        by a single process, the results are merged in the order a sequential replay would produce.
+        The lineages are found by a name-only pass over the path, the changes are then sent to the processes
+        while they are obtained, so only a few commits are held in memory at a time.
+        '''
+        lineages: Dict[Path, Path] = {}
+
+        def lineage(file_name: Path) -> Path:
+            root = lineages.setdefault(file_name, file_name)
+            while root != lineages[root]:
+                root = lineages[root]
+            while file_name != root:
+                lineages[file_name], file_name = root, lineages[file_name]
+            return root
+
+        changed_paths = list(stream_changed_paths(self, path))
+        for file_name, previous_name in changed_paths:
+            if previous_name is not None:
+                lineages[lineage(previous_name)] = lineage(file_name)
+
+        # Largest lineages first, each to the shard with the fewest changes so far
+        lineage_sizes: DefaultDict[Path, int] = defaultdict(lambda: 0)
+        for file_name, _ in changed_paths:
+            lineage_sizes[lineage(file_name)] += 1
+        shard_sizes = [0] * jobs
+        shard_of_lineage: Dict[Path, int] = {}
+        for root, size in sorted(lineage_sizes.items(), key=lambda x: -x[1]):
+            shard = shard_sizes.index(min(shard_sizes))
+            shard_of_lineage[root] = shard
+            shard_sizes[shard] += size
+
+        def shard_of(file_name: Path, file_change: Change) -> int:
+            root = lineage(file_name)
+            if file_change.previous_name is not None and lineage(file_change.previous_name) != root:
+                # Only renames found by the name-only pass may join lineages which are already being replayed
+                previous_root = lineage(file_change.previous_name)
+                assert root not in shard_of_lineage or previous_root not in shard_of_lineage, \
+                    f"Rename of {file_change.previous_name} to {file_name} was not found before the replay"
+                lineages[root] = previous_root
+                root = previous_root
+            if root not in shard_of_lineage:
+                # Only changed by merge commits, which the name-only pass leaves out
+                shard_of_lineage[root] = shard_sizes.index(min(shard_sizes))
+                shard_sizes[shard_of_lineage[root]] += 1
+            return shard_of_lineage[root]
+
+        # Files of a previous snapshot are sent along with the first change of their lineage,
+        # untouched files stay in place
+        order: Dict[Path, Tuple[int, int]] = {file_name: (-1, i) for i, file_name in enumerate(ret)}
+
+        def send(shard: int, item: Optional[ShardCommit]) -> None:
+            while True:
+                try:
+                    queues[shard].put(item, timeout=1)
+                    return
+                except queue.Full:
+                    if futures[shard].done():
+                        # Raises the exception which ended the replay of the shard
+                        futures[shard].result()
+
+        repo_path = str(self.repo.working_dir)
+        with Manager() as manager, \
+                ProcessPoolExecutor(max_workers=jobs, initializer=_init_replay_worker,
+                                    initargs=(repo_path, self.head, self.hist, self.line_ownership)) as executor:
+            queues = [manager.Queue(REPLAY_QUEUE_SIZE) for _ in range(jobs)]
+            futures = [executor.submit(_replay_shard, config, queues[shard], verbose) for shard in range(jobs)]
+            try:
+                for commit_index, (commit_hash, commit_date, file_ownership) in enumerate(commit_changes):
+                    if verbose:
+                        print(f"{INFO} Analyzing commit {commit_hash} ({commit_index + 1}/{len(path)})")
+                    by_shard: DefaultDict[int, List[Tuple[int, Path, Change]]] = defaultdict(list)
+                    for change_index, (file_name, change) in enumerate(file_ownership.items()):
+                        by_shard[shard_of(file_name, change)].append((change_index, file_name, change))
+                    for shard, shard_changes in by_shard.items():
+                        files: AnalysisResult = {}
+                        blames: Dict[Path, List[Tuple[AuthorName, str]]] = {}
+                        for _, file_name, change in shard_changes:
+                            for name in (file_name, change.previous_name):
+                                if name is not None and name in ret:
+                                    files[name] = ret.pop(name)
+                                if name is not None and name in self.unseen_blames:
+                                    blames[name] = self.unseen_blames.pop(name)
+                        send(shard, (commit_index, commit_hash, commit_date, shard_changes, files, blames))
+            finally:
+                for shard in range(jobs):
+                    if not futures[shard].done():
+                        send(shard, None)
+            for future in futures:
+                shard_ret, shard_order, output = future.result()
+                print(output, end='')
+                ret.update(shard_ret)
+                order.update(shard_order)
+
+        return dict(sorted(ret.items(), key=lambda x: order[x[0]]))
+
+    def _iter_file_changes(self, path: Iterable[str]) \
+            -> Iterator[Tuple[str, datetime.datetime, Dict[Path, 'Change']]]:
+        '''
+        Obtain the changes of each commit in the path one commit at a time through GitPython.
+        '''
+        for commit_hash in path:
+            commit_date = self.commit(commit_hash).committed_datetime
+            yield commit_hash, commit_date, get_file_changes(self, commit_hash, self.repo)
+
+    def _iter_file_changes_pipelined(self, path: Iterable[str], depth: int, workers: int) \
+            -> Iterator[Tuple[str, datetime.datetime, Dict[Path, 'Change']]]:
+        '''
+        Obtain the changes of each commit in the path through GitPython, a pool of threads works on the following
+        commits while the changes are being replayed. The changes are still returned in the order of the path.
+        At most <depth> commits are obtained ahead, fewer if their changes exceed `PIPELINE_MAX_BUFFERED_CHARS`.
+        '''
+        local = threading.local()
+        ranges: List[CommitRange] = []
+
+        def file_changes(commit_hash: str) -> Tuple[Tuple[str, datetime.datetime, Dict[Path, Change]], int]:
+            # Object readers keep a single `git cat-file` process each, every thread needs its own
+            commit_range = getattr(local, 'commit_range', None)
+            if commit_range is None:
+                commit_range = local.commit_range = copy.copy(self)
+                commit_range.repo = Repo(self.repo.working_dir)
+                commit_range.objects = GitObjectReader(commit_range.repo)
+                commit_range._commits = OrderedDict()
+                ranges.append(commit_range)
+            commit_date = commit_range.commit(commit_hash).committed_datetime
+            changes = get_file_changes(commit_range, commit_hash, commit_range.repo)
+            buffered = sum(change.content_size() for change in changes.values())
+            return (commit_hash, commit_date, changes), buffered
+
+        def buffered_chars() -> int:
+            return sum(future.result()[1] for future in pending if future.done())
+
+        commits = iter(path)
+        pending: Deque[Future] = deque()
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            while True:
+                # Back-pressure, finished changes waiting for the replay limit how far ahead the threads go
+                while len(pending) < depth and (not pending or buffered_chars() < PIPELINE_MAX_BUFFERED_CHARS):
+                    commit_hash = next(commits, None)
+                    if commit_hash is None:
+                        break
+                    pending.append(executor.submit(file_changes, commit_hash))
+                if not pending:
+                    break
+                yield pending.popleft().result()[0]
+        finally:
+            executor.shutdown(cancel_futures=True)
+            for commit_range in ranges:
+                commit_range.objects.close()
+                commit_range.repo.close()
+
+    def _apply_file_changes(self, config: Optional[Configuration], commit_hash: str, commit_date: datetime.datetime,
+                            file_ownership: Dict[Path, 'Change'], ret: AnalysisResult, verbose=False) -> None:
+        '''
+        Apply the changes made in a single commit to the ownership of the analyzed files.
+        '''
+        for file_name, change in file_ownership.items():
+            if file_name not in ret:
+                if change.hunks and change.hunks[0].mode == 'R':
+                    assert change.previous_name is not None
+                    if change.previous_name in ret:
+                        ret[file_name] = ret[change.previous_name]
+                        ret[file_name].file = file_name
+                        del ret[change.previous_name]
+                    else:
+                        self.populate_previously_unseen_file(config, change, commit_hash, file_name, ret,
+                                                             commit_date)
+                    ret[file_name].apply_change(change.hunks, commit_hash, self.repo, change.author, commit_date,
+                                                self.blame_results)
+                elif change.hunks and change.hunks[0].mode == 'A':
+                    ret[file_name] = Ownership(file_name, change.hunks[0].change_end, change.hunks[0].content,
+                                               commit_date, commit_hash, change.author, self.line_ownership)
+                elif not change.hunks and change.previous_name is not None:
+                    # Just a pure rename no other changes
+                    if change.previous_name in ret:
+                        ret[file_name] = ret[change.previous_name]
+                        ret[file_name].file = file_name
+                        del ret[change.previous_name]
+                    else:
+                        self.populate_previously_unseen_file(config, change, commit_hash, file_name, ret,
+                                                             commit_date)
+                elif not change.hunks:
+                    # This is a binary file or empty file
+                    ret[file_name] = Ownership(file_name, -1, '', commit_date, commit_hash, change.author,
+                                               self.line_ownership)
+                elif change.hunks[0].mode == 'M':
+                    # This file already existed in the repo, this can occur if the analysis does not
+                    # start from the first commit
+                    self.populate_previously_unseen_file(config, change, commit_hash, file_name, ret, commit_date)
+                continue
+
+            elif file_name in ret and change.hunks and change.hunks[0].mode == 'A' and not ret[file_name].exists:
+                # This file was deleted in a previous commit and re-added in this commit
+                ret[file_name].exists = True
+                hunk = change.hunks[0]
+                split = hunk.content.splitlines(keepends=True)
+                Ownership.fix_length(hunk, split)
+
+                content_start = hunk.change_start - 1 - hunk.content_offset
+                added = [split[content_start + i] for i in range(hunk.new_len)]
+                ret[file_name].insert_lines(hunk.prev_start, LineOwnership.of(change.author, commit_date, added))
+                ret[file_name].line_count = hunk.new_len
+                ret[file_name].record_history(commit_hash, change.hunks[0].change_end)
+                continue
+
+            elif file_name in ret and change.hunks and change.hunks[0].mode == 'D':
+                ret[file_name].delete(commit_hash)
+                continue
+
+            if len(change.hunks) == 1 and change.hunks[0].mode == 'D':
+                continue
+
+            if len(change.hunks) == 1 and change.hunks[0].mode == 'A':
+                # This file was added in a previous commit as well as in this commit
+                # Likely a conflict down the line
+                if verbose:
+                    print(f"{WARN} File {file_name} was added in a previous commit as well as in this commit.")
+                    print(f"{INFO} Replacing... (This may lead to a loss of information)")
+                    print(f"{INFO} One cause for this is Windows NTFS being case insensitive. "
+                          f"Or a merge conflict will happen.")
+                    ret[file_name] = Ownership(file_name, change.hunks[0].change_end, change.hunks[0].content,
+                                               commit_date, commit_hash, change.author, self.line_ownership)
+                    print()
+                continue
+
+            ret[file_name].apply_change(change.hunks, commit_hash, self.repo, change.author, commit_date,
+                                        self.blame_results)
+
     def find_unmerged_branches(self, end_date: Optional[float] = None) -> List[Tuple[str, List[str]]]:
         """
         Find all unmerged branches in the repository in the commit range dates,
@@ -303,20 +1231,13 @@ class CommitRange:
         """
         main_path = self.compute_path(include_merge_commits=True)
 
-        head_date = end_date if end_date is not None else self.commit(self.head).committed_date
-        hist_date = self.commit(self.hist).committed_date
-
-        reversed_path = list(main_path)
-        reversed_path.reverse()
-
-        result = self.repo.git.execute(["git", "log", "--format=%H", "--all"])
-        assert isinstance(result, str)
-        all_commits = result.splitlines()
+        table = self.commit_table
+        head_date = end_date if end_date is not None else table.committed_date(self.head)
+        hist_date = table.committed_date(self.hist)
 
         all_in_range = []
-        for commit in all_commits:
-            c = self.commit(commit)
-            if c.committed_date <= head_date and c.committed_date >= hist_date:
+        for commit, timestamp in zip(table.hexshas, table.committed_dates):
+            if timestamp <= head_date and timestamp >= hist_date:
                 all_in_range.append(commit)
 
         all_set = set(all_in_range)
@@ -328,18 +1249,16 @@ class CommitRange:
 
         outside_range = False
         for commit in starting_points:
-            if self.repo.commit(commit).committed_datetime.timestamp() < hist_date or \
-                    self.repo.commit(commit).committed_datetime.timestamp() > head_date:
+            if table.committed_date(commit) < hist_date or table.committed_date(commit) > head_date:
                 # This commit is not in the range of the analysis
                 continue
             path = []
             identifier = self.marked_commits[commit]
             current = commit
-            while current is not None and current not in main_path and not outside_range:
+            while current is not None and current not in self and not outside_range:
                 path.append(current)
-                current = self.repo.commit(current).parents[0].hexsha
-                if self.repo.commit(current).committed_datetime.timestamp() < hist_date or \
-                        self.repo.commit(current).committed_datetime.timestamp() > head_date:
+                current = table.parents[table.index[current]][0]
+                if table.committed_date(current) < hist_date or table.committed_date(current) > head_date:
                     # This commit is not in the range of the analysis
                     outside_range = True
             path.append(current)
@@ -362,13 +1281,12 @@ class CommitRange:
                 if not_first:
                     print(f'{(" " * 19)}{DOWN_ARROW}{(" " * 19)}')
                 not_first = True
-                commit_inst = repository.commit(commit)
-                author = commit_inst.author.name
+                author = self.commit_table.author(commit).name
                 assert isinstance(author, str)
                 contrib = find_contributor(contributors, author)
                 if contrib is None:
                     contrib = Contributor.unknown()
-                commit_header = str(commit_inst.message.splitlines()[0])
+                commit_header = self.commit_table.summary(commit)
 
                 print(commit + f" ({COMMIT} Commit: {commit_header} by '{contrib.name}')")
         if not unmerged_content:
@@ -381,7 +1299,7 @@ class FileSection:
     '''
 
     def __init__(self, prev_start: int, prev_len: int, change_start: int, change_len: int,
-                 content: str, prev_file_hexsha: bytes, mode: Optional[str]):
+                 content: str, prev_file_hexsha: bytes, mode: Optional[str], content_offset: int = 0):
         self.prev_start = prev_start
         self.prev_end = prev_start + prev_len
         self.prev_len = prev_len
@@ -391,6 +1309,9 @@ class FileSection:
         self.length_difference = change_len - prev_len
         self.prev_file_hexsha = prev_file_hexsha
         self.content = content
+        # Index of the first line of 'content' in the new version of the file,
+        # 0 when the content holds the whole file, otherwise the content holds only the lines of this hunk
+        self.content_offset = content_offset
         self.mode = mode
 
     def __repr__(self):
@@ -412,9 +1333,18 @@ class Change:
 
     def add_hunk(self, prev_start: int, prev_len: int, change_start: int, change_len: int,
                  content: str,
-                 previous_file_hexsha: bytes, mode: Optional[str] = None) -> None:
+                 previous_file_hexsha: bytes, mode: Optional[str] = None, content_offset: int = 0) -> None:
         self.hunks.append(
-            FileSection(prev_start, prev_len, change_start, change_len, content, previous_file_hexsha, mode))
+            FileSection(prev_start, prev_len, change_start, change_len, content, previous_file_hexsha, mode,
+                        content_offset))
+
+    def content_size(self) -> int:
+        '''
+        Number of characters of content held by the hunks.
+        Hunks holding the whole file share the same content string, which is counted only once.
+        '''
+        contents = {id(hunk.content): hunk.content for hunk in self.hunks if hunk.content}
+        return sum(map(len, contents.values()))
 
 
 class Ownership:
@@ -423,7 +1353,7 @@ class Ownership:
     '''
 
     def __init__(self, file: Path, init_line_count: int, initial_content: str, first_date: datetime.datetime,
-                 commit_hash: str, author: str = '') -> None:
+                 commit_hash: str, author: str = '', line_ownership: Type[LineOwnership] = LineOwnership) -> None:
         self.file = file
         self.history: Dict[str, OwnershipHistory] = {}
         split = initial_content.splitlines(keepends=True)
@@ -436,52 +1366,79 @@ class Ownership:
         else:
             pass
             # Empty file or binary file
-        self.changes: List[LineMetadata] = [LineMetadata(author, split[i], first_date) for i in range(init_line_count)]
+        self.changes = line_ownership.of(author, first_date, [split[i] for i in range(init_line_count)])
         if not self.changes or init_line_count == -1:
             # Empty file or binary file
-            self.changes = [LineMetadata(author, '', first_date)]
+            self.changes = line_ownership.of(author, first_date, [''])
         self.line_count = init_line_count  # Lines are indexes starting with 1
         self.exists = True
+        # Number of times the hunks did not match the file and the state was fixed with git blame
+        self.blame_fallbacks = 0
+        self._blame_fallback_commit: Optional[str] = None
 
-        self.history[commit_hash] = OwnershipHistory(commit_hash, copy.deepcopy(self.changes), init_line_count)
+        self._history_records: List[OwnershipHistory] = []
+        self.record_history(commit_hash, init_line_count)
 
     @property
     def content(self) -> str:
         '''
         Get the current content of the file, from an analysis perspective, this is the final state of the file.
         '''
-        return ''.join(map(lambda x: x.content, self.changes))
+        return ''.join(self.changes.contents)
 
     def delete(self, commit_hash: str) -> None:
         '''
         Mark the file as deleted, the information will be kept in the history in case the file is added again
         '''
-        self.history[commit_hash] = OwnershipHistory(commit_hash, copy.deepcopy(self.changes), self.line_count)
-        self.changes = []
+        self.record_history(commit_hash, self.line_count)
+        self.changes.clear()
         self._line_count = 0
         self.exists = False
 
-    def fix_file(self, repo: Repo, commit_hash: str, date: datetime.datetime) -> None:
+    def fix_file(self, repo: Repo, commit_hash: str, date: datetime.datetime,
+                 blame_results: Optional[Dict[Tuple[str, str], List[Tuple[AuthorName, str]]]] = None) -> None:
         '''
         In case direct analysis of hunks fails, this function will try to fix the current state of the file by
         parsing the output of git blame.
         This approach is not as fast as the direct hunk analysis, but is reliable.
+
+        :param blame_results: Blame output of the repository from previous calls, see `CommitRange.blame_results`
+        '''
+        file_path = posix_repo_p(str(self.file), repo)
+        blamed_lines = blame_results.get((commit_hash, file_path)) if blame_results is not None else None
+        if blamed_lines is None:
+            blame_res = repo.blame(commit_hash, file_path)
+            assert blame_res is not None
+            blamed_lines = []
+            for section in blame_res:
+                commit = section[0]
+                assert isinstance(commit, Commit)
+                lines = section[1]
+                assert isinstance(lines, list)
+                blamed_lines.extend((commit.author.name, str(line)) for line in lines)
+            if blame_results is not None:
+                if len(blame_results) >= BLAME_CACHE_SIZE:
+                    del blame_results[next(iter(blame_results))]
+                blame_results[commit_hash, file_path] = blamed_lines
+        self.assign_blame(blamed_lines, date)
+
+    def assign_blame(self, blamed_lines: List[Tuple[AuthorName, str]], date: datetime.datetime) -> None:
+        '''
+        Replace the current state of the file with the lines reported by git blame.
+
+        :param blamed_lines: The author and content of every line of the file
         '''
-        blame_res = repo.blame(commit_hash, posix_repo_p(str(self.file), repo))
-        assert blame_res is not None
-        self.changes = []
-        for section in blame_res:
-            commit = section[0]
-            assert isinstance(commit, Commit)
-            lines = section[1]
-            assert isinstance(lines, list)
-            self.changes.extend([LineMetadata(commit.author.name, str(line), date) for line in lines])
-            self.line_count = len(self.changes)
+        self.changes.clear()
+        self.changes.extend([LineMetadata(author, line, date) for author, line in blamed_lines])
+        self.line_count = len(self.changes)
 
     def apply_change(self, hunks: List[FileSection], commit_hash: str, repo: Repo,
-                     author: AuthorName, date: datetime.datetime) -> None:
+                     author: AuthorName, date: datetime.datetime,
+                     blame_results: Optional[Dict[Tuple[str, str], List[Tuple[AuthorName, str]]]] = None) -> None:
         '''
         Record the changes made to the file in the current commit
+
+        :param blame_results: Passed to `fix_file` when the hunks do not match the file
         '''
 
         assert not any(map(lambda x: x.mode in ['A', 'D'], hunks)), \
@@ -506,21 +1463,15 @@ class Ownership:
                 split = hunk.content.splitlines(keepends=True)
                 self.fix_length(hunk, split)
 
-                for l in range(1, hunk.new_len + 1):
-                    index = hunk.change_start - 1 + hunk.new_len - l
-                    text = split[index]
-                    self.changes.insert(hunk.prev_start + new_file_index_offset,
-                                        LineMetadata(author, text, date))
+                content_start = hunk.change_start - 1 - hunk.content_offset
+                added = [split[content_start + i] for i in range(hunk.new_len)]
+                self.insert_lines(hunk.prev_start + new_file_index_offset, LineOwnership.of(author, date, added))
                 new_file_index_offset += hunk.new_len
                 abs_changes += hunk.new_len
                 self.line_count += hunk.new_len
             elif hunk.new_len == 0:
                 # This is a deletion
-                for _ in range(hunk.prev_len):
-                    try:
-                        self.changes.pop(hunk.change_start)
-                    except IndexError:
-                        self.fix_file(repo, commit_hash, date)
+                self.remove_lines(hunk.change_start, hunk.prev_len, repo, commit_hash, date, blame_results)
 
                 new_file_index_offset -= hunk.prev_len
                 abs_changes += hunk.prev_len
@@ -529,26 +1480,68 @@ class Ownership:
                 split = hunk.content.splitlines(keepends=True)
                 self.fix_length(hunk, split)
                 # This is a change
-                new_meta = [LineMetadata(author, split[hunk.change_start - 1 + i], date) for i in range(hunk.new_len)]
+                content_start = hunk.change_start - 1 - hunk.content_offset
+                new_lines = LineOwnership.of(author, date, [split[content_start + i] for i in range(hunk.new_len)])
                 file_start = hunk.prev_start - 1 + new_file_index_offset
-                prev_line_authors = []
-                for i in range(hunk.prev_len):
-                    try:
-                        prev_line_authors.append((self.changes[file_start].author, self.changes[file_start].content))
-                        self.changes.pop(file_start)
-                    except IndexError:
-                        self.fix_file(repo, commit_hash, date)
-                for i in range(hunk.new_len):
-                    if hunk.new_len - 1 - i < len(prev_line_authors) and \
-                            new_meta[hunk.new_len - 1 - i].content.strip() == \
-                            prev_line_authors[hunk.new_len - 1 - i][1].strip():
-                        new_meta[hunk.new_len - 1 - i].author = prev_line_authors[hunk.new_len - 1 - i][0]
-                    self.changes.insert(file_start, new_meta[hunk.new_len - 1 - i])
+                prev_lines = self.remove_lines(file_start, hunk.prev_len, repo, commit_hash, date, blame_results)
+                for i in range(min(hunk.new_len, len(prev_lines))):
+                    if new_lines.contents[i].strip() == prev_lines.contents[i].strip():
+                        # Whitespace changes do not change the author of the line
+                        new_lines.set_author_id(i, prev_lines.author_id(i))
+                self.insert_lines(file_start, new_lines)
                 new_file_index_offset += hunk.length_difference
                 abs_changes += hunk.length_difference
                 self.line_count += hunk.length_difference
 
-        self.history[commit_hash] = OwnershipHistory(commit_hash, copy.deepcopy(self.changes), abs_changes)
+        self.record_history(commit_hash, abs_changes)
+
+    def insert_lines(self, index: int, lines: LineOwnership) -> None:
+        '''
+        Insert the lines before <index>.
+        '''
+        if 0 <= index <= len(self.changes):
+            self.changes[index:index] = lines
+        else:
+            # Outside the file the lines are inserted one by one in reverse, as `list.insert` would do
+            for line in reversed(list(lines)):
+                self.changes.insert(index, line)
+
+    def remove_lines(self, index: int, count: int, repo: Repo, commit_hash: str, date: datetime.datetime,
+                     blame_results: Optional[Dict[Tuple[str, str], List[Tuple[AuthorName, str]]]] = None) \
+            -> LineOwnership:
+        '''
+        Remove <count> lines starting at <index>.
+        If the file has fewer lines than expected, its state is fixed with `fix_file` and the removal continues.
+        The state is fixed at most once per commit, further missing lines of the same commit are skipped.
+
+        :return: The removed lines
+        '''
+        if 0 <= index and index + count <= len(self.changes):
+            removed = self.changes[index:index + count]
+            del self.changes[index:index + count]
+            return removed
+        removed = LineOwnership()
+        for _ in range(count):
+            try:
+                removed.append(self.changes.pop(index))
+            except IndexError:
+                if self._blame_fallback_commit != commit_hash:
+                    self._blame_fallback_commit = commit_hash
+                    self.blame_fallbacks += 1
+                    self.fix_file(repo, commit_hash, date, blame_results)
+        return removed
+
+    def record_history(self, commit_hash: str, lines_changed: int) -> None:
+        '''
+        Record the current ownership of the file in the history.
+        Only the lines modified since the previous record are stored.
+        '''
+        start, removed, inserted = self.changes.take_modified()
+        record = OwnershipHistory(commit_hash, lines_changed, self._history_records, start, removed, inserted,
+                                  len(self.changes), self.changes.size,
+                                  self.changes[0].change_date if self.changes else None)
+        self._history_records.append(record)
+        self.history[commit_hash] = record
 
     def _apply_conflict_resolution(self, author: str, hunk: FileSection, date: datetime.datetime) -> None:
         '''
@@ -566,22 +1559,61 @@ class Ownership:
         else:
             pass
             # Empty file or binary file
-        self.changes = [LineMetadata(author, split[i], date) for i in range(init_line_count)]
+        self.changes[:] = LineOwnership.of(author, date, [split[i] for i in range(init_line_count)])
         self._line_count = init_line_count
 
     @staticmethod
     def fix_length(hunk, split):
         has_newline = split[-1].endswith('\n')
         had_newline = hunk.content.endswith('\n')
-        if not has_newline and hunk.change_end == len(split) and had_newline:
+        content_end = hunk.content_offset + len(split)
+        if not has_newline and hunk.change_end == content_end and had_newline:
             hunk.new_len -= 1
-        elif has_newline and hunk.change_end == len(split) and not had_newline:
+        elif has_newline and hunk.change_end == content_end and not had_newline:
             split.append('')
 
     def __str__(self):
         return f"Ownership(lines={self.line_count}, changes={self.changes})"
 
 
+def get_conflict_changes(commit_range: CommitRange, commit_hash: str, author: str,
+                         b_names: List[str]) -> Dict[Path, Change]:
+    """
+    Get the changes of a merge commit, the resolved files are taken over by the author of the merge commit
+
+    :param commit_hash: The hash of the merge commit
+    :param author: The author of the merge commit
+    :param b_names: Repository relative names of the files changed by the merge commit
+    """
+    repo = commit_range.repo
+    ret = {}
+    for i in range(len(b_names)):
+        if commit_range.is_ignored(b_names[i]):
+            continue
+        try:
+            content = commit_range.checkout_file_from(commit_hash, b_names[i])
+        except Exception as e:
+            content = None
+            print(f"{WARN} There is a conflict and the resolved file could not be read! Commit: {commit_hash}.")
+            print(f"{WARN} This file will be marked as binary.")
+            print(f"{WARN} Exception: {e}")
+            print()
+
+        change = Change(author)
+        actual_path = Path(repo_p(b_names[i], repo))
+        ret[actual_path] = change
+        if content is None:
+            change.is_binary = True
+        else:
+            print(f"{WARN} There is a conflict in file {actual_path}. Commit: {commit_hash}.")
+            print(f"{INFO} It appears to be resolvable... however, "
+                  f"ownership will be transferred to the author of this commit.")
+            print()
+
+        change.add_hunk(0, 0, 0, 0, content, b"", "CONFLICT")
+    return ret
+
+
 def get_file_changes(commit_range: CommitRange, commit_hash: str, repo: Repo) -> Dict[Path, Change]:
     """
     Get the ownership of each file in the commit with the hash <commit_hash>
@@ -598,30 +1630,7 @@ def get_file_changes(commit_range: CommitRange, commit_hash: str, repo: Repo) ->
             result = repo.git.execute(['git', 'show', commit_hash, "--cc", "--unified=0"])
             assert isinstance(result, str)
             b_names = CONFLICT_B_NAME.findall(result)
-            ret = {}
-            for i in range(len(b_names)):
-                try:
-                    content = repo.git.execute(['git', 'show', f'{commit_hash}:{b_names[i]}'])
-                    assert isinstance(content, str)
-                except Exception as e:
-                    content = None
-                    print(f"{WARN} There is a conflict and the resolved file could not be read! Commit: {commit_hash}.")
-                    print(f"{WARN} This file will be marked as binary.")
-                    print(f"{WARN} Exception: {e}")
-                    print()
-
-                change = Change(commit.author.name)
-                actual_path = Path(repo_p(b_names[i], repo))
-                ret[actual_path] = change
-                if content is None:
-                    change.is_binary = True
-                else:
-                    print(f"{WARN} There is a conflict in file {actual_path}. Commit: {commit_hash}.")
-                    print(f"{INFO} It appears to be resolvable... however, "
-                          f"ownership will be transferred to the author of this commit.")
-                    print()
-
-                change.add_hunk(0, 0, 0, 0, content, b"", "CONFLICT")
+            ret = get_conflict_changes(commit_range, commit_hash, commit.author.name, b_names)
             return ret
         elif len(commit.parents) == 1:
             # This is a linear commit
@@ -636,6 +1645,8 @@ def get_file_changes(commit_range: CommitRange, commit_hash: str, repo: Repo) ->
     ret = {}
 
     for diff in d:
+        if _skip_ignored_diff(commit_range, commit.author.name, diff.a_path, diff.b_path, diff.renamed, ret, repo):
+            continue
         try:
             unified_diff_str = diff.diff.decode('utf-8')
         except UnicodeDecodeError:
@@ -657,8 +1668,8 @@ def get_file_changes(commit_range: CommitRange, commit_hash: str, repo: Repo) ->
             mode = "R"
             ret[actual_path].previous_name = repo_p(diff.a_path, repo)
         try:
-            content = diff.b_blob.data_stream.read().decode('latin-1') if diff.b_blob is not None else \
-                diff.a_blob.data_stream.read().decode('latin-1')
+            blob = diff.b_blob if diff.b_blob is not None else diff.a_blob
+            content = commit_range.objects.read(blob.hexsha).decode('latin-1')
         except Exception as e:
             content = None
             if not diff.renamed:
@@ -680,63 +1691,603 @@ def get_file_changes(commit_range: CommitRange, commit_hash: str, repo: Repo) ->
     return ret
 
 
-def calculate_percentage(contributors: List[Contributor], result: AnalysisResult) -> Percentage:
+def _skip_ignored_diff(commit_range: CommitRange, author: str, a_path: Optional[str], b_path: Optional[str],
+                       renamed: bool, ret: Dict[Path, Change], repo: Repo) -> bool:
     '''
-    Calculates the percentage of ownership for each contributor globally and per-file in the given result
+    Check whether the diff of a file matching the ignore list should be skipped.
+    A file renamed to an ignored path is no longer analyzed, it is recorded as deleted under its previous name.
+
+    :return: True if the diff should not be parsed
+    '''
+    path = b_path if b_path is not None else a_path
+    if path is None or not commit_range.is_ignored(path):
+        return False
+    if renamed and a_path is not None and not commit_range.is_ignored(a_path):
+        change = Change(author)
+        change.add_hunk(1, 0, 0, 0, '', b'', 'D')
+        ret[repo_p(a_path, repo)] = change
+    return True
+
+
+class DiffHeader:
+    '''
+    Header of a single file diff in the `git log` output.
+    Paths and flags are resolved the same way GitPython resolves them for `get_file_changes`.
+    '''
+
+    def __init__(self, header_lines: List[bytes]) -> None:
+        a_fallback: Optional[bytes] = None
+        b_fallback: Optional[bytes] = None
+        a_path: Optional[bytes] = None
+        b_path: Optional[bytes] = None
+        rename_from: Optional[bytes] = None
+        rename_to: Optional[bytes] = None
+        self.new_file = False
+        self.is_gitlink = False
+        self.a_blob: Optional[str] = None
+        self.b_blob: Optional[str] = None
+
+        for line in header_lines:
+            line = line.rstrip(b'\n')
+            if line.startswith(b'diff --git '):
+                match = DIFF_GIT_HEADER_PATTERN.match(line)
+                if match is not None:
+                    a_fallback, b_fallback = match.groups()
+            elif line.startswith(b'rename from '):
+                rename_from = line[len(b'rename from '):]
+            elif line.startswith(b'rename to '):
+                rename_to = line[len(b'rename to '):]
+            elif line.startswith(b'new file mode '):
+                self.new_file = True
+                self.is_gitlink = line.endswith(b'160000')
+            elif line.startswith(b'index '):
+                blobs, _, mode = line[len(b'index '):].partition(b' ')
+                a_blob, _, b_blob = blobs.partition(b'..')
+                self.a_blob = a_blob.decode() if a_blob.strip(b'0') else None
+                self.b_blob = b_blob.decode() if b_blob.strip(b'0') else None
+                self.is_gitlink = self.is_gitlink or mode == b'160000'
+            elif line.startswith(b'--- '):
+                a_path = re.split(rb'[\t\r\f\v]', line[len(b'--- '):])[0]
+            elif line.startswith(b'+++ '):
+                b_path = re.split(rb'[\t\r\f\v]', line[len(b'+++ '):])[0]
+
+        self.a_path = _pick_diff_path(a_path, rename_from, a_fallback)
+        self.b_path = _pick_diff_path(b_path, rename_to, b_fallback)
+        self.renamed = _decode_diff_path(rename_from, False) != _decode_diff_path(rename_to, False)
+
+
+def _unquote_git_path(path: bytes) -> bytes:
+    '''
+    Git quotes paths with unusual characters in C style, e.g. "src/\\303\\251.java"
+    '''
+    def unescape(match: re.Match) -> bytes:
+        escaped = match.group(1)
+        if len(escaped) == 3:
+            return bytes([int(escaped, 8)])
+        return QUOTED_PATH_ESCAPES.get(escaped, escaped)
+
+    return QUOTED_PATH_ESCAPE_PATTERN.sub(unescape, path)
+
+
+def _decode_diff_path(path: Optional[bytes], has_ab_prefix: bool = True) -> Optional[str]:
+    if path is None or path == b'/dev/null':
+        return None
+    if path.startswith(b'"') and path.endswith(b'"'):
+        path = _unquote_git_path(path[1:-1])
+    if has_ab_prefix:
+        path = path[2:]
+    return path.decode('utf-8', 'replace')
+
+
+def _pick_diff_path(path: Optional[bytes], rename: Optional[bytes], fallback: Optional[bytes]) -> Optional[str]:
+    if path:
+        return _decode_diff_path(path)
+    if rename:
+        return _decode_diff_path(rename, False)
+    if fallback:
+        return _decode_diff_path(fallback)
+    return None
+
+
+def _create_streamed_change(commit_hash: str, author: str, header: DiffHeader,
+                            hunks: List[Tuple[Tuple[int, int, int, int], List[str]]],
+                            ret: Dict[Path, Change], repo: Repo) -> None:
+    '''
+    Convert a single parsed file diff into a Change, the counterpart of the diff loop in `get_file_changes`
+    '''
+    path = header.b_path if header.b_path is not None else header.a_path
+    assert path is not None, f"Could not determine the path of a changed file in commit {commit_hash}"
+    actual_path = repo_p(path, repo)
+
+    ret[actual_path] = Change(author)
+    if header.b_path is None:
+        mode = "D"
+    else:
+        mode = "A" if header.new_file else "M"
+    if header.renamed:
+        mode = "R"
+        assert header.a_path is not None
+        ret[actual_path].previous_name = repo_p(header.a_path, repo)
+
+    if header.is_gitlink or (header.a_blob is None and header.b_blob is None and not header.renamed):
+        # Submodules and pure mode changes have no content to assign ownership to
+        print(f"{WARN} Could not read content of {actual_path} in commit {commit_hash}.")
+        print(f"{WARN} This file will be marked as binary.")
+        hunks = []
+
+    prev_file_hexsha = header.a_blob if header.a_blob is not None else header.b_blob
+    for (prev_start, prev_len, change_start, change_len), lines in hunks:
+        # Only the added lines are known, they are stored with an offset of the first added line
+        ret[actual_path].add_hunk(prev_start, prev_len, change_start, change_len, ''.join(lines),
+                                  prev_file_hexsha, mode, max(change_start - 1, 0))
+    if not hunks and not header.renamed:
+        ret[actual_path].is_binary = True
+
+
+def parse_file_changes_stream(commit_range: CommitRange, lines: Iterable[bytes], repo: Repo) \
+        -> Iterator[Tuple[str, datetime.datetime, Dict[Path, Change]]]:
+    """
+    Parse the output of `git log` with patches into per-commit changes.
+    Each commit has to start with a line in the `STREAM_LOG_FORMAT` format.
+
+    :param lines: Raw lines of the `git log` output
+    :return: Commit hash, commit date and changes of each commit in the order they appear in the output
+    """
+    commit_hash: Optional[str] = None
+    parents: List[str] = []
+    author = ''
+    commit_date: Optional[datetime.datetime] = None
+    changes: Dict[Path, Change] = {}
+    b_names: List[str] = []
+
+    header_lines: Optional[List[bytes]] = None
+    header: Optional[DiffHeader] = None
+    hunks: List[Tuple[Tuple[int, int, int, int], List[str]]] = []
+    in_hunk = False
+    previous_added = False
+    # The current file matches the ignore list, its lines are skipped until the next file
+    ignored = False
+
+    def skip_ignored() -> bool:
+        assert header is not None
+        return _skip_ignored_diff(commit_range, author, header.a_path, header.b_path, header.renamed, changes, repo)
+
+    def finish_file() -> None:
+        nonlocal header_lines, header, hunks, in_hunk, ignored
+        if header_lines is not None and len(parents) < 2 and not ignored:
+            assert commit_hash is not None
+            if header is None:
+                header = DiffHeader(header_lines)
+            if not skip_ignored():
+                _create_streamed_change(commit_hash, author, header, hunks, changes, repo)
+        header_lines = None
+        header = None
+        hunks = []
+        in_hunk = False
+        ignored = False
+
+    def finish_commit() -> Tuple[str, datetime.datetime, Dict[Path, Change]]:
+        finish_file()
+        assert commit_hash is not None and commit_date is not None
+        if len(parents) == 2:
+            return commit_hash, commit_date, get_conflict_changes(commit_range, commit_hash, author, b_names)
+        if len(parents) > 2:
+            print(f"{WARN} Octopus merge detected: {len(parents)} parents for commit {commit_hash}.")
+            print(f"{WARN} This is unfortunately not supported. This commit will hold no diffs.")
+            return commit_hash, commit_date, {}
+        return commit_hash, commit_date, changes
+
+    for line in lines:
+        if line.startswith(STREAM_COMMIT_MARKER):
+            if commit_hash is not None:
+                yield finish_commit()
+            fields = line[1:].rstrip(b'\n').split(STREAM_COMMIT_MARKER)
+            commit_hash = fields[0].decode()
+            parents = fields[1].decode().split()
+            timestamp, timezone = fields[2].decode().split()
+            commit_date = from_timestamp(int(timestamp), utctz_to_altz(timezone))
+            author = commit_range.ownership_overrides.get(commit_hash, fields[3].decode('utf-8', 'replace'))
+            changes = {}
+            b_names = []
+            continue
+
+        if in_hunk:
+            if line.startswith(b'+'):
+                hunks[-1][1].append(line[1:].decode('latin-1'))
+                previous_added = True
+                continue
+            if line.startswith(b'-'):
+                previous_added = False
+                continue
+            if line.startswith(b'\\'):
+                # "\ No newline at end of file" refers to the previous line
+                if previous_added:
+                    hunks[-1][1][-1] = hunks[-1][1][-1][:-1]
+                continue
+            in_hunk = False
+
+        if ignored and not line.startswith(b'diff '):
+            continue
+
+        if line.startswith(b'diff '):
+            finish_file()
+            header_lines = [line]
+        elif header_lines is not None and line.startswith(b'@@'):
+            if len(parents) >= 2:
+                # Combined diffs of merge commits only provide the names of the changed files
+                header_lines = None
+                continue
+            if header is None:
+                header = DiffHeader(header_lines)
+                if skip_ignored():
+                    ignored = True
+                    continue
+            match = HUNK_HEADER_PATTERN.match(line.decode('latin-1'))
+            assert match is not None, f"Invalid hunk header in commit {commit_hash}: {line!r}"
+            prev_line_start, prev_line_len, line_start, line_len = match.groups()
+            hunks.append(((int(prev_line_start), int(prev_line_len) if prev_line_len is not None else 1,
+                           int(line_start), int(line_len) if line_len is not None else 1), []))
+            in_hunk = True
+            previous_added = False
+        elif header_lines is not None and not hunks:
+            if len(parents) == 2:
+                match = CONFLICT_B_NAME.match(line.decode('utf-8', 'surrogateescape'))
+                if match is not None:
+                    b_names.append(match.group(1))
+            else:
+                header_lines.append(line)
+
+    if commit_hash is not None:
+        yield finish_commit()
+
+
+def stream_file_changes(commit_range: CommitRange, commits: Iterable[str], repo: Repo) \
+        -> Iterator[Tuple[str, datetime.datetime, Dict[Path, Change]]]:
+    """
+    Get the changes of all given commits from a single `git log` process.
+    The output is parsed incrementally, and is equivalent to calling `get_file_changes` for each commit.
+
+    :param commits: The hashes of the commits to analyze, the order is preserved
+    :param repo: The repository to analyze
+    :return: Commit hash, commit date and changes of each commit
+    """
+    args = ['git', 'log', '--no-walk=unsorted', '--stdin', '--root', '--cc', '-M', '--unified=0', '--full-index',
+            '--diff-algorithm=default', '--no-color', '--no-ext-diff', '--no-textconv', '--no-relative',
+            '--src-prefix=a/', '--dst-prefix=b/', '--no-show-signature', '--date=raw', f'--format={STREAM_LOG_FORMAT}']
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(args, cwd=repo.working_dir, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=stderr)
+        assert process.stdin is not None and process.stdout is not None
+        try:
+            process.stdin.write(''.join(f'{commit}\n' for commit in commits).encode())
+            process.stdin.close()
+            yield from parse_file_changes_stream(commit_range, process.stdout, repo)
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise GitCommandError(args, process.returncode, stderr.read())
+
+
+def _iter_nul_separated(stream: IO[bytes], chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        *fields, pending = (pending + chunk).split(b'\0')
+        yield from fields
+    if pending:
+        yield pending
+
+
+def _count_lines(content: bytes) -> int:
+    '''
+    Number of lines as counted by `git diff --numstat`.
+    '''
+    return content.count(b'\n') + (1 if content and not content.endswith(b'\n') else 0)
+
+
+def stream_commit_stats(commit_range: CommitRange, commits: Iterable[str]) -> Iterator[Tuple[str, CommitStats]]:
+    """
+    Get the inserted and deleted lines and the changed files of all given commits from a single `git log` process.
+    Renames are detected for the changed files, the line counts of a renamed file are those of deleting the old
+    file and adding the new one, the same as `Commit.stats` reports.
+
+    :param commits: The hashes of the commits to analyze
+    :return: Commit hash and the statistics of each commit
+    """
+    args = ['git', 'log', '--no-walk=unsorted', '--stdin', '--root', '--diff-merges=first-parent', '-M', '--raw',
+            '--numstat', '--no-abbrev', '-z', '--no-color', '--no-ext-diff', '--no-textconv', '--no-relative',
+            f'--format={STATS_COMMIT_MARKER}%H']
+    repo = commit_range.repo
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(args, cwd=repo.working_dir, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=stderr)
+        assert process.stdin is not None and process.stdout is not None
+        try:
+            process.stdin.write(''.join(f'{commit}\n' for commit in commits).encode())
+            process.stdin.close()
+
+            fields = (field.decode('utf-8', 'surrogateescape').lstrip('\n')
+                      for field in _iter_nul_separated(process.stdout))
+            commit_hash: Optional[str] = None
+            stats = CommitStats()
+            # Blobs of renamed files, by the new path
+            renamed_blobs: Dict[str, Tuple[str, str]] = {}
+            for field in fields:
+                if field.startswith(STATS_COMMIT_MARKER):
+                    if commit_hash is not None:
+                        yield commit_hash, stats
+                    commit_hash = field[len(STATS_COMMIT_MARKER):]
+                    stats = CommitStats()
+                    renamed_blobs = {}
+                elif field.startswith(':'):
+                    # :<old mode> <new mode> <old blob> <new blob> <status>, then one or two paths
+                    _, _, old_blob, new_blob, status = field.split()
+                    path = next(fields)
+                    if status[0] in 'RC':
+                        path = next(fields)
+                    if status[0] == 'R':
+                        renamed_blobs[path] = (old_blob, new_blob)
+                    if status[0] in stats.flags:
+                        stats.flags[status[0]].append(Path(path))
+                elif field:
+                    added, deleted, path = field.split('\t')
+                    if not path:
+                        # Renamed file, the old and the new path follow
+                        next(fields)
+                        path = next(fields)
+                    if added == '-':
+                        # Binary file
+                        continue
+                    if path in renamed_blobs:
+                        old_blob, new_blob = renamed_blobs[path]
+                        added = str(_count_lines(commit_range.objects.read(new_blob)))
+                        deleted = str(_count_lines(commit_range.objects.read(old_blob)))
+                    stats.insertions += int(added)
+                    stats.deletions += int(deleted)
+            if commit_hash is not None:
+                yield commit_hash, stats
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise GitCommandError(args, process.returncode, stderr.read())
+
+
+def stream_changed_paths(commit_range: CommitRange, commits: Iterable[str]) \
+        -> Iterator[Tuple[Path, Optional[Path]]]:
+    """
+    Get the files changed by all given commits from a single `git log` process, without reading any diff.
+    Renames are detected the same way as for `get_file_changes`, merge commits are left out.
+
+    :param commits: The hashes of the commits to analyze
+    :return: The path of every changed file and its previous path if it was renamed
+    """
+    args = ['git', 'log', '--no-walk=unsorted', '--stdin', '--root', '--diff-merges=off', '-M', '--name-status',
+            '-z', '--no-color', '--no-relative', f'--format={STATS_COMMIT_MARKER}%H']
+    repo = commit_range.repo
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(args, cwd=repo.working_dir, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=stderr)
+        assert process.stdin is not None and process.stdout is not None
+        try:
+            process.stdin.write(''.join(f'{commit}\n' for commit in commits).encode())
+            process.stdin.close()
+
+            fields = (field.decode('utf-8', 'replace').lstrip('\n') for field in _iter_nul_separated(process.stdout))
+            for field in fields:
+                if not field or field.startswith(STATS_COMMIT_MARKER):
+                    continue
+                # <status>, then one or two paths
+                path = next(fields)
+                if field[0] in 'RC':
+                    previous_path, path = path, next(fields)
+                    yield repo_p(path, repo), repo_p(previous_path, repo) if field[0] == 'R' else None
+                else:
+                    yield repo_p(path, repo), None
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise GitCommandError(args, process.returncode, stderr.read())
+
+
+# Commit range of the repository replayed by the current process of the process pool
+_replay_commit_range: Optional[CommitRange] = None
+
+
+def blame_file(repo_path: str, commit_hash: str, file_name: str) -> List[Tuple[AuthorName, str]]:
+    '''
+    Blame a file at <commit_hash> through `git blame --porcelain`.
+
+    :return: The author and content of every line of the file
+    :raises subprocess.CalledProcessError: If git is unable to blame the file
+    '''
+    output = subprocess.run(['git', 'blame', '--porcelain', commit_hash, '--', file_name], cwd=repo_path,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+    authors: Dict[bytes, AuthorName] = {}
+    ret: List[Tuple[AuthorName, str]] = []
+    commit = b''
+    expect_header = True
+    for line in output.split(b'\n'):
+        if line.startswith(b'\t'):
+            # Trailing whitespace is dropped and undecodable lines are kept as bytes, the same as `Repo.blame` does
+            content = line[1:].rstrip()
+            try:
+                ret.append((authors[commit], content.decode('utf-8')))
+            except UnicodeDecodeError:
+                ret.append((authors[commit], str(content)))
+            expect_header = True
+        elif expect_header:
+            # <commit> <original line> <final line> [<lines in group>], commit details follow only once
+            commit = line.split(b' ', 1)[0]
+            expect_header = False
+        elif line.startswith(b'author '):
+            authors[commit] = line[len(b'author '):].decode('utf-8', 'replace')
+    return ret
+
+
+def _init_replay_worker(repo_path: str, head: str, hist: str, line_ownership: Type[LineOwnership]) -> None:
+    global _replay_commit_range
+    _replay_commit_range = CommitRange(Repo(repo_path), head, hist)
+    _replay_commit_range.line_ownership = line_ownership
+
+
+def _replay_shard(config: Optional[Configuration], commits: 'queue.Queue[Optional[ShardCommit]]', verbose: bool) \
+        -> Tuple[AnalysisResult, Dict[Path, Tuple[int, int]], str]:
+    '''
+    Replay the changes of a single shard in a process of the process pool.
+    The changes are taken from <commits> until None is received.
+
+    :return: The ownership of the files, the position of the change which added each file to the result
+             and the output of the replay
     '''
-    ret: Dict[Path, List[Tuple[Contributor, float]]] = {}
-    author_total: DefaultDict[Contributor, int] = defaultdict(lambda: 0)
-    lines_total = 0
+    assert _replay_commit_range is not None
+    _replay_commit_range.unseen_blames = {}
+    ret: AnalysisResult = {}
+    order: Dict[Path, Tuple[int, int]] = {}
+    output = io.StringIO()
+    with redirect_stdout(output):
+        for commit_index, commit_hash, commit_date, changes, files, blames in iter(commits.get, None):
+            ret.update(files)
+            _replay_commit_range.unseen_blames.update(blames)
+            for change_index, file_name, change in changes:
+                added = file_name not in ret
+                _replay_commit_range._apply_file_changes(config, commit_hash, commit_date, {file_name: change}, ret,
+                                                         verbose)
+                if added and file_name in ret:
+                    order[file_name] = (commit_index, change_index)
+    return ret, order, output.getvalue()
+
+
+def ownership_snapshot_file(commit_range: CommitRange, cache_dir: Path) -> Path:
+    '''
+    Location of the ownership snapshot of a repository analyzed from the initial commit of the commit range.
+    '''
+    repo_path = Path(commit_range.repo.working_dir).resolve()
+    key = hashlib.sha1(f"{repo_path}\0{commit_range.hist}".encode('utf-8')).hexdigest()
+    return cache_dir / f"{key}.ownership"
+
+
+def _snapshot_settings(commit_range: CommitRange, config: Optional[Configuration]) -> Tuple:
+    '''
+    Settings which influence the analysis result, a snapshot created with different settings can not be reused.
+    '''
+    blame_unseen = config.blame_unseen if config is not None else False
+    ignore = commit_range.ignore.patterns if commit_range.ignore is not None else None
+    return OWNERSHIP_SNAPSHOT_VERSION, blame_unseen, sorted(commit_range.ownership_overrides.items()), ignore
+
+
+def load_ownership_snapshot(commit_range: CommitRange, cache_dir: Path, config: Optional[Configuration]) \
+        -> Optional[Tuple[List[str], AnalysisResult]]:
+    '''
+    Load the analysis result of a previous run together with the commits it was computed from.
+    Nothing is returned if the snapshot does not exist, was created with different settings or its head commit
+    is no longer an ancestor of the analyzed head (e.g. after a force-push), a full analysis is needed then.
+    '''
+    snapshot_file = ownership_snapshot_file(commit_range, cache_dir)
+    if not snapshot_file.exists():
+        return None
+    try:
+        with open(snapshot_file, 'rb') as f:
+            snapshot = pickle.load(f)
+    except Exception as e:
+        print(f"{WARN} Could not read ownership snapshot {snapshot_file}, the whole history will be analyzed.")
+        print(f"{WARN} Exception: {e}")
+        return None
+
+    if snapshot['settings'] != _snapshot_settings(commit_range, config):
+        print(f"{INFO} Ownership snapshot was created with different settings, the whole history will be analyzed.")
+        return None
+    try:
+        is_ancestor = commit_range.repo.is_ancestor(snapshot['head'], commit_range.head)
+    except GitCommandError:
+        # The snapshot head no longer exists in the repository
+        is_ancestor = False
+    if not is_ancestor:
+        print(f"{WARN} Snapshot commit {snapshot['head']} is not an ancestor of {commit_range.head}, "
+              f"the whole history will be analyzed.")
+        return None
+    return snapshot['commits'], snapshot['result']
+
+
+def store_ownership_snapshot(commit_range: CommitRange, cache_dir: Path, config: Optional[Configuration],
+                             commits: List[str], result: AnalysisResult) -> None:
+    '''
+    Store the analysis result so that a later run only has to analyze the commits that are not in <commits>.
+    '''
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    snapshot_file = ownership_snapshot_file(commit_range, cache_dir)
+    snapshot = {
+        'settings': _snapshot_settings(commit_range, config),
+        'head': commit_range.head,
+        'commits': commits,
+        'result': result,
+    }
+    # Write to a temporary file first, an interrupted run must not leave a broken snapshot behind
+    tmp_file = snapshot_file.with_suffix('.tmp')
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, snapshot_file)
+
+
+def contribution_matrix(contributors: List[Contributor], result: AnalysisResult) -> ContributionMatrix:
+    '''
+    Builds the sparse files × contributors matrix of owned lines from the analysis result
+    '''
+    matrix = ContributionMatrix(contributors)
+    column_of_contributor = {id(contributor): column for column, contributor in enumerate(contributors)}
+    column_of_author: Dict[int, Optional[int]] = {}
 
     for path, val in result.items():
-        ret[path] = []
-        intermediate: DefaultDict[Contributor, int] = defaultdict(lambda: 0)
-        for line_meta in val.changes[1:]:
-            contributor = find_contributor(contributors, line_meta.author)
-            if contributor is not None:
-                intermediate[contributor] = intermediate[contributor] + 1
-                author_total[contributor] = author_total[contributor] + 1
-            lines_total += 1
-        file_lines = len(val.changes[1:])
-        for contributor, lines in intermediate.items():
-            ret[path].append((contributor, lines / file_lines))
+        line_counts = val.changes.author_line_counts(1)
+        matrix.add_file(path, sum(line_counts.values()))
+        for author_id, line_count in line_counts.items():
+            if author_id not in column_of_author:
+                contributor = find_contributor(contributors, line_author(author_id))
+                column_of_author[author_id] = None if contributor is None else column_of_contributor[id(contributor)]
+            column = column_of_author[author_id]
+            if column is not None:
+                matrix.add(path, column, line_count)
 
-    totals: DefaultDict = defaultdict(lambda: 0)
+    return matrix
 
-    for contributor, authors_total_lines in author_total.items():
-        totals[contributor] = authors_total_lines / lines_total
 
-    return Percentage(ret, totals)
+def calculate_percentage(contributors: List[Contributor], result: AnalysisResult) -> Percentage:
+    '''
+    Calculates the percentage of ownership for each contributor globally and per-file in the given result
+    '''
+    return contribution_matrix(contributors, result).percentage()
 
 
-def construct_unmerged_tree(unmerged_commits: Set[str], all_commits: Set[str], repo: Repo) -> Dict[str, List[str]]:
+def construct_unmerged_tree(unmerged_commits: Set[str], all_commits: Set[str], repo: Repo,
+                            table: Optional[CommitTable] = None) -> Dict[str, List[str]]:
     """
     Construct a tree of all unmerged commits
 
     :param unmerged_commits: A set of all unmerged commits
     :param all_commits: A list of all commits in the repository
     :param repo: The repository to analyze
+    :param table: Commit table of the repository, read from <repo> when not given
     :return: A dictionary mapping each commit to a list of its children
     """
+    if table is None:
+        table = CommitTable(repo)
     ret: Dict[str, List[str]] = {}
     for commit in all_commits:
-        ret[commit] = []
-
-    visited: Set[str] = set()
-    q: Deque[str] = deque()
-
-    for commit in unmerged_commits:
-        q.append(commit)
-        while q:
-            curr = q.popleft()
-            if curr in visited:
-                continue
-            visited.add(curr)
-            for parent in repo.commit(curr).parents:
-                if parent.hexsha in all_commits:
-                    ret[parent.hexsha].append(curr)
-                    if parent.hexsha in unmerged_commits:
-                        q.append(parent.hexsha)
+        # Only unmerged commits are descended into, their parents within <all_commits> get them as children
+        ret[commit] = [child for child in table.children(commit) if child in unmerged_commits]
     return ret
 
 
@@ -745,8 +2296,10 @@ def create_path(parent: str, tree: Dict[str, List[str]], repo: Repo, paths: List
     Create a path from a commit to the root of the tree
     '''
     ret: List[str] = []
-    children = tree[parent]
-    for child in children:
+    # Depth first, the same order as descending into every child in turn, without the recursion limit
+    stack = list(reversed(tree[parent]))
+    while stack:
+        child = stack.pop()
         ret.append(child)
-        ret.extend(create_path(child, tree, repo, paths))
+        stack.extend(reversed(tree[child]))
     return ret
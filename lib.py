@@ -4,18 +4,20 @@ File holding all the utility functions and classes.
 from __future__ import annotations
 
 import os
+import re
 from collections import defaultdict
 from pathlib import Path
-from typing import Union, List, Optional, Set, Dict, Tuple, DefaultDict, Any, TYPE_CHECKING
+from typing import Union, List, Optional, Set, Dict, Tuple, DefaultDict, Any, Iterator, Iterable, Pattern, \
+    TYPE_CHECKING
 from unidecode import unidecode
 
-from git import Repo, Commit, Actor
+from git import Repo, Commit, Actor, InvalidGitRepositoryError, NoSuchPathError
 
 from uni_chars import *
 
 if TYPE_CHECKING:
     from configuration import Configuration
-    from history_analyzer import CommitRange
+    from history_analyzer import CommitRange, CommitFiles
 
 # Adapted from https://gist.github.com/onero/2983bf817fc88b7fe7beb6041e1c5b0a
 ignore_list = os.path.join(Path(__file__).parent, "data", "ignore-list.txt")
@@ -57,11 +59,11 @@ def stats_for_contributor(contributor: Contributor, commit_range: CommitRange) -
     '''
     insertions = 0
     deletions = 0
+    commit_stats = commit_range.commit_stats
     for commit_sha in commit_range:
-        commit = commit_range.commit(commit_sha)
-        if contributor == commit.author and str(commit.hexsha) in commit_range:
-            insertions += commit.stats.total['insertions']
-            deletions += commit.stats.total['deletions']
+        if contributor == commit_range.author(commit_sha):
+            insertions += commit_stats[commit_sha].insertions
+            deletions += commit_stats[commit_sha].deletions
     return insertions, deletions
 
 
@@ -81,46 +83,19 @@ class FlaggedFiles:
         self.paths[flag].extend(paths)
 
 
-def get_files_with_flags(commit: Commit) -> Dict[str, List[Union[int, List[Any]]]]:
-    '''
-    Get all files that have been flagged as added, removed, modified or deleted by Git.
-    :param commit:
-    :return: A dictionary with the flags as keys and a list of the number of files and the paths of the files as values.
-    '''
-    # TODO Refactor this so that get_files_with_flags and FlaggedFiles.update are merged into one function
-    flags = ["A", "R", "D", "M"]
-    result: Dict[str, List[Union[int, List[Any]]]] = {flag: [0, []] for flag in flags}
-    parent: Optional[Commit] = None
-    if commit.parents:
-        parent = commit.parents[0]
-
-    if parent is None:
-        result["A"] = [len(commit.tree.blobs), [Path(file.name) for file in commit.tree.blobs]]
-        return result
-
-    for diff in parent.diff(commit):
-        if diff.change_type in flags:
-            result[diff.change_type][0] += 1  # type: ignore
-            result[diff.change_type][1].append(Path(diff.b_path))  # type: ignore
-    return result
-
-
 def get_flagged_files_by_contributor(commit_range: CommitRange, contributors: List[Contributor]) \
         -> Dict[Contributor, FlaggedFiles]:
     result = {}
+    commit_stats = commit_range.commit_stats
     for commit_hexsha in commit_range:
-        commit = commit_range.commit(commit_hexsha)
-        author = commit.author
+        author = commit_range.author(commit_hexsha)
         contributor = next((c for c in contributors if c == author), None)
         if contributor is None:
             continue
         if contributor not in result:
             result[contributor] = FlaggedFiles()
-        flagged_files = get_files_with_flags(commit)
-        for flag, (count, paths) in flagged_files.items():
-            assert isinstance(count, int), f"Count is not an int: {count}, this is very much not expected... How?"
-            assert isinstance(paths, list), f"Paths is not a list: {paths}, this is very much not expected... How?"
-            result[contributor].update(flag, count, paths)
+        for flag, paths in commit_stats[commit_hexsha].flags.items():
+            result[contributor].update(flag, len(paths), paths)
     return result
 
 
@@ -131,51 +106,218 @@ def try_checkout(repo: Repo, commit_hash: str, force: bool = False) -> None:
         print(f"Failed to checkout {commit_hash} {e} - Are there any uncommitted changes?")
 
 
-def _ignored_files() -> List[str]:
-    """
-    Get a list of all ignored files, for this purpose a general list matching most common generated files is used.
-    """
+class _IgnorePatternGroup:
+    '''
+    Consecutive ignore patterns of the same polarity compiled together.
+    Patterns without a slash are tested against the last path component, the ones without wildcards by a set lookup,
+    the rest by a single alternation. Patterns with a slash are tested against the end of the path or, when they
+    start with a slash, against the whole path.
+    '''
+    def __init__(self, negated: bool):
+        self.negated = negated
+        self.names: List[str] = []
+        self.suffixes: List[str] = []
+        self.anchored: List[str] = []
+        self.dir_names: List[str] = []
+        self.dir_suffixes: List[str] = []
+        self.dir_anchored: List[str] = []
+
+    def add(self, pattern: str, dir_only: bool):
+        anchored = pattern.startswith('/')
+        pattern = pattern.lstrip('/')
+        if pattern.startswith('**/'):
+            pattern = pattern[3:]
+        if anchored:
+            kind = 'anchored'
+        elif '/' in pattern:
+            kind = 'suffixes'
+        else:
+            kind = 'names'
+        getattr(self, 'dir_' + kind).append(pattern)
+        if not dir_only:
+            getattr(self, kind).append(pattern)
+
+    def compile(self):
+        self.file_matcher = self._compile(self.names, self.suffixes, self.anchored)
+        self.dir_matcher = self._compile(self.dir_names, self.dir_suffixes, self.dir_anchored)
+
+    @staticmethod
+    def _compile(names: List[str], suffixes: List[str], anchored: List[str]) \
+            -> Tuple[Set[str], Optional[Pattern[str]], Optional[Pattern[str]], Optional[Pattern[str]]]:
+        literals = {n for n in names if not _has_wildcard(n)}
+        globs = [_translate_glob(n) for n in names if _has_wildcard(n)]
+        return (literals,
+                re.compile('|'.join(globs)) if globs else None,
+                re.compile('(?:^|/)(?:' + '|'.join(map(_translate_glob, suffixes)) + ')$') if suffixes else None,
+                re.compile('|'.join(map(_translate_glob, anchored))) if anchored else None)
+
+    def matches(self, path: str, is_dir: bool) -> bool:
+        literals, names, suffixes, anchored = self.dir_matcher if is_dir else self.file_matcher
+        name = path.rpartition('/')[2]
+        return name in literals or \
+            (names is not None and names.fullmatch(name) is not None) or \
+            (suffixes is not None and suffixes.search(path) is not None) or \
+            (anchored is not None and anchored.fullmatch(path) is not None)
+
+
+def _has_wildcard(pattern: str) -> bool:
+    return any(c in pattern for c in '*?[\\')
+
+
+def _translate_glob(pattern: str) -> str:
+    '''
+    Translates a gitignore glob to a regular expression, '*' and '?' do not match '/' and '**' matches across directories.
+    '''
     ret: List[str] = []
-    with open(ignore_list, 'r') as f:
-        for line in f:
-            if line.isspace() or line.startswith('#') \
-                    or line.startswith('/'):  # This is not supported by `pathlib.Path.rglob`
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            ret.append('(?:[^/]*/)*')
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            ret.append('.*')
+            i += 2
+            continue
+        if c == '*':
+            ret.append('[^/]*')
+        elif c == '?':
+            ret.append('[^/]')
+        elif c == '\\' and i + 1 < len(pattern):
+            i += 1
+            ret.append(re.escape(pattern[i]))
+        elif c == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            content = pattern[i + 1:end]
+            if content.startswith('!'):
+                content = '^' + content[1:]
+            ret.append('[' + content.replace('\\', '\\\\') + ']')
+            i = end
+        else:
+            ret.append(re.escape(c))
+        i += 1
+    return ''.join(ret)
+
+
+class IgnoreMatcher:
+    '''
+    Matches repository relative posix paths against an ignore list using the gitignore pattern syntax.
+    Later patterns take precedence and '!' re-includes a path, a path inside an ignored directory stays ignored.
+    Unlike in .gitignore, patterns containing a slash are not anchored to the root unless they start with one,
+    the analyzed project often lives in a subdirectory of the repository.
+    '''
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = []
+        self.groups: List[_IgnorePatternGroup] = []
+        for line in patterns:
+            line = line.strip()
+            if not line or line.startswith('#'):
                 continue
-            ret.append(line.strip())
-    return ret
+            self.patterns.append(line)
+            negated = line.startswith('!')
+            if negated:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+            if not self.groups or self.groups[-1].negated != negated:
+                self.groups.append(_IgnorePatternGroup(negated))
+            self.groups[-1].add(line, dir_only)
+        for group in self.groups:
+            group.compile()
+        self._ignored_dirs: Dict[str, bool] = {}
+
+    def _matches(self, path: str, is_dir: bool) -> bool:
+        for group in reversed(self.groups):
+            if group.matches(path, is_dir):
+                return not group.negated
+        return False
+
+    def _dir_ignored(self, directory: str) -> bool:
+        ignored = self._ignored_dirs.get(directory)
+        if ignored is None:
+            parent = directory.rpartition('/')[0]
+            ignored = (parent != '' and self._dir_ignored(parent)) or self._matches(directory, True)
+            self._ignored_dirs[directory] = ignored
+        return ignored
+
+    def matches(self, path: str, is_dir=False) -> bool:
+        '''
+        Check if a path is ignored
+
+        :param path: Repository relative path using '/' as the separator
+        :param is_dir: The path points to a directory
+        :return: True if the path or any of its parent directories is ignored
+        '''
+        if is_dir:
+            return self._dir_ignored(path)
+        parent = path.rpartition('/')[0]
+        return (parent != '' and self._dir_ignored(parent)) or self._matches(path, False)
+
+
+_ignore_matchers: Dict[str, IgnoreMatcher] = {}
+
+
+def ignore_matcher(ignore_file: str = ignore_list) -> IgnoreMatcher:
+    """
+    The compiled matcher for an ignore list, for this purpose a general list matching most common generated files is
+    used. The list is compiled once per process.
+    """
+    matcher = _ignore_matchers.get(ignore_file)
+    if matcher is None:
+        with open(ignore_file, 'r') as f:
+            matcher = IgnoreMatcher(f)
+        _ignore_matchers[ignore_file] = matcher
+    return matcher
 
 
-def get_tracked_files(project_root: Union[Path, Repo], verbose=False) -> List[FileGroup]:
+def get_tracked_files(project_root: Union[Path, Repo], verbose=False,
+                      commit_files: Optional[CommitFiles] = None) -> List[FileGroup]:
     """
     Find all files that are version controlled, relative to the project root
 
     :param project_root: The root directory of the project
+    :param commit_files: Take the files of this commit instead of the files in the index, no checkout is needed
     :return: A dictionary of all directories and their files which are related to each other
     """
-    ret: List[FileGroup] = []
-
     if project_root is None:
         raise ValueError(f"{ERROR} No project_root specified! Did you execute all code blocks above?")
 
+    repo: Optional[Repo] = None
     if isinstance(project_root, Repo):
+        repo = project_root
         repo_dir = project_root.working_dir
         assert repo_dir is not None
         project_root = Path(repo_dir)
+    else:
+        try:
+            repo = Repo(project_root)
+        except (InvalidGitRepositoryError, NoSuchPathError):
+            pass
+
+    matcher = ignore_matcher()
+    if commit_files is not None:
+        files = list(commit_files.blobs)
+    elif repo is not None:
+        files = _ls_files(repo)
+    else:
+        files = _walk_files(project_root, matcher)
+
+    groups: Dict[str, FileGroup] = {}
+    root = str(project_root)
+    for file in files:
+        if matcher.matches(file):
+            continue
+        directory, _, name = file.rpartition('/')
+        group = groups.get(directory)
+        if group is None:
+            group = FileGroup(os.path.join(root, *directory.split('/')) if directory else root, [])
+            groups[directory] = group
+        group.files.append(Path(group.name).joinpath(name))
 
-    for root, dirs, files in os.walk(project_root):
-        to_remove = []
-        for directory in dirs:
-            if is_ignored(Path(root).joinpath(directory)) or directory == '.git':
-                to_remove.append(directory)
-        for directory in to_remove:
-            dirs.remove(directory)
-        file_group = FileGroup(root, [])
-        for file in files:
-            if is_ignored(Path(root).joinpath(file)):
-                continue
-            file_group.files.append(Path(root).joinpath(file))
-        if file_group.files:
-            ret.append(file_group)
+    ret = list(groups.values())
 
     if verbose:
         print(f"{SUCCESS} Found {len(ret)} groups of related files.")
@@ -183,18 +325,34 @@ def get_tracked_files(project_root: Union[Path, Repo], verbose=False) -> List[Fi
     return ret
 
 
-def is_ignored(file: Path) -> bool:
-    """
-    Check if a file is ignored
+def _ls_files(repo: Repo) -> List[str]:
+    '''
+    Repository relative paths of all files in the index which are present in the working tree.
+    Submodules are not descended into.
+    '''
+    deleted = set(repo.git.ls_files('-z', '--deleted').split('\0'))
+    ret: List[str] = []
+    for entry in repo.git.ls_files('-z', '--stage').split('\0'):
+        if not entry:
+            continue
+        info, path = entry.split('\t', 1)
+        if info.startswith('160000') or path in deleted:
+            continue
+        ret.append(path)
+    return ret
 
-    :param file: The file to check
-    :return: True if the file is ignored, False otherwise
-    """
-    ignored = _ignored_files()
-    for ignore in ignored:
-        if file.match(ignore):
-            return True
-    return False
+
+def _walk_files(project_root: Path, matcher: IgnoreMatcher) -> List[str]:
+    '''
+    Relative paths of all files under a directory which is not a repository, ignored directories are not entered.
+    '''
+    ret: List[str] = []
+    for root, dirs, files in os.walk(project_root):
+        relative = Path(os.path.relpath(root, project_root)).as_posix()
+        prefix = '' if relative == '.' else relative + '/'
+        dirs[:] = [d for d in dirs if d != '.git' and not matcher.matches(prefix + d, True)]
+        ret.extend(prefix + f for f in files)
+    return ret
 
 
 def filter_related_groups(groups: List[FileGroup]) -> List[FileGroup]:
@@ -251,8 +409,23 @@ class Contributor:
         self.email = email
         self.anonymized = False
         self.aliases: List['Contributor'] = []
+        # The resolver which merged the contributor and the set it belongs to, None for contributors created ad-hoc
+        self.identity: Optional[Tuple[ContributorResolver, Tuple[str, ...]]] = None
+
+    @property
+    def identity_key(self) -> Tuple[Any, ...]:
+        '''
+        Key deciding equality with other contributors and the hash.
+        Contributors resolved together share the identity of their set, other contributors are identified by their
+        name and email.
+        '''
+        if self.identity is not None:
+            return self.identity
+        return self.name, self.email
 
     def contrib_equal(self, other: Union[Actor, Contributor]):
+        if isinstance(other, Contributor):
+            return self.identity_key == other.identity_key
         return self.name == other.name or self.email == other.email or \
             any([a.contrib_equal(other) for a in self.aliases])
 
@@ -266,7 +439,8 @@ class Contributor:
         return self.contrib_equal(other)
 
     def __hash__(self):
-        return hash(self.name) + hash(self.email)
+        # Every alias of a resolved person shares the identity and therefore lands in the same bucket
+        return hash(self.identity_key)
 
     def __str__(self):
         if self.anonymized:
@@ -291,66 +465,225 @@ class Percentage:
     Global contribution is the contribution to the whole project. It acts as a cache of
     '''
     def __init__(self, file_per_contributor: Dict[Path, List[Tuple[Contributor, float]]],
-                 global_contribution: DefaultDict[Contributor, float]):
+                 global_contribution: DefaultDict[Contributor, float],
+                 matrix: Optional[ContributionMatrix] = None):
         self.file_per_contributor = file_per_contributor
         self.global_contribution = global_contribution
+        self.matrix = matrix
+
+
+class ContributionMatrix:
+    '''
+    Sparse matrix of owned line counts, rows are files and columns are contributors.
+    It is computed once after the history replay, percentages and file ownership are derived from it.
+    '''
+    def __init__(self, contributors: List[Contributor]):
+        self.contributors = contributors
+        self.rows: Dict[Path, Dict[int, int]] = {}
+        self.file_lines: Dict[Path, int] = {}
+        self.column_totals: DefaultDict[int, int] = defaultdict(int)
+        self.lines_total = 0
+
+    def add_file(self, file: Path, lines: int):
+        '''
+        Adds a row for the file, <lines> is the total line count of the file including unattributed lines.
+        '''
+        self.rows[file] = {}
+        self.file_lines[file] = lines
+        self.lines_total += lines
+
+    def add(self, file: Path, column: int, lines: int):
+        row = self.rows[file]
+        row[column] = row.get(column, 0) + lines
+        self.column_totals[column] += lines
+
+    def items(self) -> Iterator[Tuple[Path, List[Tuple[Contributor, float]]]]:
+        '''
+        Yields every file with the share of its lines owned by each contributor.
+        '''
+        for file, row in self.rows.items():
+            file_lines = self.file_lines[file]
+            yield file, [(self.contributors[column], lines / file_lines) for column, lines in row.items()]
+
+    def percentage(self) -> Percentage:
+        totals: DefaultDict = defaultdict(lambda: 0)
+        for column, lines in self.column_totals.items():
+            totals[self.contributors[column]] = lines / self.lines_total
+        return Percentage(dict(self.items()), totals, self)
+
+    def file_ownership(self, threshold: float, repo: Optional[Repo] = None) -> FileOwnership:
+        '''
+        Files in which a contributor owns more than <threshold> of the lines.
+        '''
+        ret = FileOwnership()
+        for file, row in self.rows.items():
+            file_lines = self.file_lines[file]
+            for column, lines in row.items():
+                if lines / file_lines > threshold:
+                    ret[self.contributors[column]].append(ContributionDistribution(file, 1, repo))
+        return ret
+
+
+class FileOwnership(DefaultDict[Contributor, List['ContributionDistribution']]):
+    '''
+    Files fully owned by each contributor, with a reverse index from a file to its owner.
+    The index is built on the first lookup, the mapping is not expected to change afterwards.
+    '''
+    def __init__(self, default_factory=list):
+        super().__init__(default_factory)
+        self._owners: Optional[Dict[Path, Contributor]] = None
+
+    def owner(self, file: Path) -> Optional[Contributor]:
+        if self._owners is None:
+            self._owners = {}
+            for contributor, distributions in self.items():
+                for distribution in distributions:
+                    self._owners.setdefault(distribution.file, contributor)
+        return self._owners.get(file)
+
+
+class ContributorResolver:
+    '''
+    Union-find over the identities of commit authors.
+    Every author identity (name and email pair) is a node which is joined with its name, its unidecode-normalized
+    name and its email, depending on what to match on. `contributor_map` pairs join all identities of the two names.
+    Each resulting set is one person.
+    '''
+    def __init__(self, match_on_name=True, match_on_email=True):
+        self.match_on_name = match_on_name
+        self.match_on_email = match_on_email
+        self._parent: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+        self._identities_by_name: DefaultDict[str, List[Tuple[str, ...]]] = defaultdict(list)
+
+    def _find(self, node: Tuple[str, ...]) -> Tuple[str, ...]:
+        root = self._parent.setdefault(node, node)
+        while self._parent[root] != root:
+            root = self._parent[root]
+        # Path compression
+        while node != root:
+            self._parent[node], node = root, self._parent[node]
+        return root
+
+    def _union(self, a: Tuple[str, ...], b: Tuple[str, ...]):
+        root_a = self._find(a)
+        root_b = self._find(b)
+        if root_a != root_b:
+            self._parent[root_b] = root_a
+
+    def add(self, contributor: Contributor):
+        '''
+        Registers an author identity.
+        '''
+        identity = ('identity', contributor.name, contributor.email)
+        self._find(identity)
+        self._identities_by_name[contributor.name].append(identity)
+        if self.match_on_name:
+            self._union(identity, ('name', contributor.name))
+        if self.match_on_email:
+            self._union(identity, ('email', contributor.email))
+        self._union(identity, ('name', unidecode(contributor.name)))
+
+    def join(self, name: str, other_name: str):
+        '''
+        Declares two names to belong to the same person.
+        '''
+        pair = ('pair', name, other_name)
+        for identity in self._identities_by_name.get(name, []) + self._identities_by_name.get(other_name, []):
+            self._union(pair, identity)
+
+    def key(self, contributor: Contributor) -> Tuple[str, ...]:
+        '''
+        The representative node of the set the contributor belongs to.
+        '''
+        return self._find(('identity', contributor.name, contributor.email))
+
+    def identity(self, contributor: Contributor) -> Tuple[ContributorResolver, Tuple[str, ...]]:
+        '''
+        Identity of the set the contributor belongs to, sets of different resolvers never share an identity.
+        '''
+        return self, self.key(contributor)
+
+
+class ContributorList(List[Contributor]):
+    '''
+    List of contributors with a lookup table from every name and email (including aliases) to the contributor.
+    The table is built on the first search, the list is not expected to change afterwards.
+    '''
+    def __init__(self, contributors: List[Contributor], identities: Optional[Dict[str, Contributor]] = None):
+        super().__init__(contributors)
+        self._identities = identities if identities is not None else {}
+        self._lookup: Optional[Dict[str, Contributor]] = None
+
+    def find(self, author: str) -> Optional[Contributor]:
+        if self._lookup is None:
+            self._lookup = contributor_lookup(self)
+            for identity, contributor in self._identities.items():
+                self._lookup.setdefault(identity, contributor)
+        return self._lookup.get(author)
+
+
+def contributor_lookup(contributors: List[Contributor]) -> Dict[str, Contributor]:
+    '''
+    Maps every name and email a contributor is known by to the contributor.
+    When two contributors share a name, the one earlier in the list wins, same as a linear search would.
+    '''
+    lookup: Dict[str, Contributor] = {}
+    for contributor in contributors:
+        lookup.setdefault(contributor.name, contributor)
+        lookup.setdefault(contributor.email, contributor)
+        for alias in contributor.aliases:
+            lookup.setdefault(alias.name, contributor)
+            lookup.setdefault(alias.email, contributor)
+            for nested in alias.aliases:
+                lookup.setdefault(nested.name, contributor)
+    return lookup
 
 
 def get_contributors(config: 'Configuration', commit_range: CommitRange, match_on_name=True,
                      match_on_email=True) -> List[Contributor]:
     """
     Get a list of all contributors in a commit range. Based on the configuration the returned list may be anonymized.
+    Authors are merged into one contributor when they share a name or an email, when their names differ only in
+    diacritics or when the `contributor_map` pairs them. The first identity seen in the range becomes the primary one.
     """
-    contributors: Set[Contributor] = set()
-    commits = [commit_range.commit(x) for x in commit_range]
-
-    for commit in commits:
-        contributors.add(Contributor(commit.author.name, commit.author.email))
-
+    resolver = ContributorResolver(match_on_name, match_on_email)
+    authors: Dict[Tuple[str, str], Contributor] = {}
+    for sha in commit_range:
+        author = commit_range.author(sha)
+        if (author.name, author.email) not in authors:
+            contributor = Contributor(author.name, author.email)
+            authors[(author.name, author.email)] = contributor
+            resolver.add(contributor)
+
+    if config.contributor_map:
+        for a, b in config.contributor_map:
+            resolver.join(a, b)
+
+    groups: Dict[Tuple[str, ...], Contributor] = {}
+    identities: Dict[str, Contributor] = {}
     matched_contributors: List[Contributor] = []
-    for it in contributors:
-        matched = False
-        for other in matched_contributors:
-            if it.name == other.name and it.email == other.email:
-                continue
-            if it.name == other.name or it.email == other.email and (match_on_name and match_on_email):
-                other.append_alias(it)
-                matched = True
-                break
-            if it.name == other.name and match_on_name and not match_on_email:
-                other.append_alias(it)
-                matched = True
-                break
-            if it.email == other.email and match_on_email and not match_on_name:
-                other.append_alias(it)
-                matched = True
-                break
-            if config.contributor_map is not None or config.contributor_map:
-                for a, b in config.contributor_map:
-                    if it.name == a and other.name == b or \
-                            it.name == b and other.name == a:
-                        other.append_alias(it)
-                        matched = True
-                        break
-                    if it.name in [a, b]:
-                        if a in map(lambda o: o.name, other.aliases) or \
-                                b in map(lambda o: o.name, other.aliases):
-                            matched = True
-                            other.append_alias(it)
-                            break
-            if it.normalized in other.aliases and not matched:
-                matched = True
-                other.append_alias(it)
-                break
-
-        if not matched:
-            it.append_alias(Contributor(unidecode(it.name), it.email))
+    for it in authors.values():
+        key = resolver.key(it)
+        primary = groups.get(key)
+        if primary is None:
+            normalized = it.normalized
+            it.identity = normalized.identity = resolver.identity(it)
+            it.append_alias(normalized)
+            groups[key] = it
             matched_contributors.append(it)
+        else:
+            it.identity = primary.identity
+            primary.append_alias(it)
+        # Aliases sharing a name with an existing one are not kept, their emails still resolve to the contributor
+        identities.setdefault(it.name, groups[key])
+        identities.setdefault(it.email, groups[key])
 
     if config.anonymous_mode:
         count = 1
         for contributor in matched_contributors:
-            contributor.aliases.append(Contributor(contributor.name, contributor.email))
+            original = Contributor(contributor.name, contributor.email)
+            original.identity = contributor.identity
+            contributor.aliases.append(original)
             contributor.name = f"Anonymous #{count}"
             contributor.email = f"contributor{count}@email.cz"
             contributor.anonymized = True
@@ -358,22 +691,16 @@ def get_contributors(config: 'Configuration', commit_range: CommitRange, match_o
 
     matched_contributors.append(Contributor.unknown())
 
-    return matched_contributors
+    return ContributorList(matched_contributors, identities)
 
 
 def find_contributor(contributors: List[Contributor], author: str) -> Optional[Contributor]:
     '''
     Helper function to find a contributor by their name.
     '''
-    for contributor in contributors:
-        if author == contributor.name or author == contributor.email:
-            return contributor
-        if author in contributor.aliases:
-            return contributor
-        if author in list(map(lambda x: x.name, contributor.aliases)) or \
-                author in list(map(lambda x: x.email, contributor.aliases)):
-            return contributor
-    return None
+    if isinstance(contributors, ContributorList):
+        return contributors.find(author)
+    return contributor_lookup(contributors).get(author)
 
 
 class ContributionDistribution:
@@ -397,9 +724,10 @@ class ContributionDistribution:
         return f"{repo_p(str(self.file), self.repo)} ({self.percentage})"
 
 
-def compute_file_ownership(percentage: Percentage, config: Configuration, repo: Repo) \
-        -> Dict[Contributor, List[ContributionDistribution]]:
-    ret: Dict[Contributor, List[ContributionDistribution]] = defaultdict(list)
+def compute_file_ownership(percentage: Percentage, config: Configuration, repo: Repo) -> FileOwnership:
+    if percentage.matrix is not None:
+        return percentage.matrix.file_ownership(config.full_ownership_min_threshold, repo)
+    ret = FileOwnership()
     for file, percentages in percentage.file_per_contributor.items():
         for contributor, contrib_percent in percentages:
             if contrib_percent > config.full_ownership_min_threshold:
@@ -28,11 +28,11 @@ import semantic_analysis
 from analyzers.plots.commit_ditribution import plot_commits
 from analyzers.dir_tree import build_tree, print_tree
 from configuration import Configuration, start_sonar
-from file_analyzer import FileWeight
-from history_analyzer import AnalysisResult, calculate_percentage, CommitRange
+from file_analyzer import FileWeight, SyntacticWeightCache
+from history_analyzer import AnalysisResult, calculate_percentage, CommitRange, RunLengthLineOwnership, CommitFiles
 from lib import FileGroup, Contributor, get_contributors, compute_file_ownership, find_contributor, \
-    stats_for_contributor, get_flagged_files_by_contributor, ContributionDistribution, Percentage, \
-    FlaggedFiles, repo_p, get_tracked_files
+    stats_for_contributor, get_flagged_files_by_contributor, FileOwnership, Percentage, \
+    FlaggedFiles, repo_p, get_tracked_files, ignore_matcher
 from remote_repository_weight_model import RemoteRepositoryWeightModel
 from repository_hooks import parse_project, RemoteRepository, DummyRepository
 from semantic_analysis import LangElement
@@ -46,17 +46,6 @@ from uni_chars import *
 ContributorWeight = Dict[Contributor, float]
 
 
-def get_owner(ownership: Dict[Contributor, List[ContributionDistribution]], file: Path) -> Optional[Contributor]:
-    '''
-    Reverse lookup for the owner of a file
-    '''
-
-    for k, v in ownership.items():
-        if file in map(lambda x: x.file, v):
-            return k
-    return None
-
-
 '''
 Helper functions for output formatting
 '''
@@ -100,13 +89,13 @@ def display_commit_info(commit_range: CommitRange, repo: Repo, contributors: Lis
     Driver function for commit overview
     '''
 
-    header(f"{COMMIT} Total commits: {len(commit_range.compute_path())}", machine_id="commits")
+    header(f"{COMMIT} Total commits: {len(commit_range)}", machine_id="commits")
 
     commit_distribution: Dict[Contributor, int] = defaultdict(lambda: 0)
 
+    commit_table = commit_range.commit_table
     for commit in commit_range:
-        raw_commit = commit_range.commit(commit)
-        author = raw_commit.author.name
+        author = commit_range.author(commit).name
         if author is None:
             continue
         contributor = find_contributor(contributors, author)
@@ -114,9 +103,8 @@ def display_commit_info(commit_range: CommitRange, repo: Repo, contributors: Lis
             print(f'{INFO} Autor {author} not found in contributors. Skipping commit.')
             continue
         commit_distribution[contributor] += 1
-        split = repo.commit(commit).message.splitlines()
-        message = split[0] if len(split) > 0 else ''
-        print(f'Commit: {commit} - Msg: "{message}" - Date: `{raw_commit.committed_datetime}` by {CONTRIBUTOR} {contributor.name}')  # type: ignore
+        message = commit_table.summary(commit)
+        print(f'Commit: {commit} - Msg: "{message}" - Date: `{commit_table.committed_datetime(commit)}` by {CONTRIBUTOR} {contributor.name}')  # type: ignore
 
     if config.prescan_mode:
         return commit_distribution, []
@@ -173,7 +161,7 @@ def insertions_deletions_info(insertions_deletions: List[Tuple[Contributor, int,
 
 def display_percentage_info(analysis_res: AnalysisResult, contributors: List[Contributor], config: Configuration,
                             repo: Repo) \
-        -> Tuple[Percentage, Dict[Contributor, List[ContributionDistribution]]]:
+        -> Tuple[Percentage, FileOwnership]:
     '''
     Driver code for calculating and displaying percentage information.
     '''
@@ -209,15 +197,15 @@ def display_dir_tree(percentage: Percentage, repo: Repo):
 
     triples = []
 
-    for key in percentage.file_per_contributor.keys():
-        for name, percent in percentage.file_per_contributor[key]:
+    for key, percentages in percentage.file_per_contributor.items():
+        for name, percent in percentages:
             triples.append((Path(os.path.relpath(key, repo.working_dir)), percent, name))
 
     tree = build_tree(triples)
     print_tree(tree)
 
 
-def display_rule_info(config: Configuration, repo: Repo, ownership: Dict[Contributor, List[ContributionDistribution]],
+def display_rule_info(config: Configuration, repo: Repo, ownership: FileOwnership,
                       contributors: List[Contributor], remote_project: RemoteRepository) -> Dict[Contributor, float]:
     '''
     Driver code for Rule based analysis
@@ -294,15 +282,21 @@ def display_rule_info(config: Configuration, repo: Repo, ownership: Dict[Contrib
     return ret
 
 
-def local_syntax_analysis(config: Configuration, grouped_files: List[FileGroup]) -> Dict[Path, FileWeight]:
+def local_syntax_analysis(config: Configuration, grouped_files: List[FileGroup],
+                          commit_files: Optional[CommitFiles] = None, jobs: int = 1,
+                          cache_dir: Optional[Path] = None) -> Dict[Path, FileWeight]:
     ret: Dict[Path, FileWeight] = {}
-    for group in grouped_files:
-        for file in group.files:
-            result = file_analyzer.compute_syntactic_weight(file, config)
-            if not result:
-                print(f"{INFO} Could not read text from {file} -> Unsupported format or Binary file!")
-                continue
-            ret[file] = result
+    files = [file for group in grouped_files for file in group.files]
+    cache = SyntacticWeightCache(cache_dir, config) if cache_dir is not None else None
+    weights = file_analyzer.compute_syntactic_weights(files, config, commit_files, jobs, cache=cache)
+    if cache is not None:
+        cache.save()
+        print(f"{INFO} Syntactic weight of {cache.hits} files was taken from the cache.")
+    for file, result in zip(files, weights):
+        if not result:
+            print(f"{INFO} Could not read text from {file} -> Unsupported format or Binary file!")
+            continue
+        ret[file] = result
     return ret
 
 
@@ -407,11 +401,14 @@ def start_sonar_analysis(config: Configuration, repository_path: str) \
     return project_key, container
 
 
-def display_local_syntax_info(config: Configuration, ownership: Dict[Contributor, List[ContributionDistribution]],
+def display_local_syntax_info(config: Configuration, ownership: FileOwnership,
                               local_syntax: Dict[Path, FileWeight], repo: Repo, file_maturity_score: Dict[Path, float],
-                              n_extreme_files: int = 5) -> ContributorWeight:
+                              n_extreme_files: int = 5, contributors: Optional[List[Contributor]] = None,
+                              history_analysis: Optional[AnalysisResult] = None) -> ContributorWeight:
     '''
     Driver function for local syntax analysis.
+    With `config.line_syntax_attribution`, the weight of a file is split between the owners of its lines,
+    otherwise it goes to the owner of the whole file.
     '''
 
     header(f"{SYNTAX} Local Syntax Analysis", machine_id="local_syntax")
@@ -429,6 +426,13 @@ def display_local_syntax_info(config: Configuration, ownership: Dict[Contributor
     ret: ContributorWeight = defaultdict(lambda: 0.0)
     per_contributor = defaultdict(list)
 
+    line_shares = None
+    if config.line_syntax_attribution:
+        assert contributors is not None and history_analysis is not None, \
+            "Contributors and history analysis are needed to attribute the weight of lines!"
+        line_shares = file_analyzer.line_weight_shares(contributors, local_syntax, history_analysis)
+        print(f"{INFO} Weight of files is split between the owners of their lines.")
+
     for file, file_weight_inst in local_syntax.items():
         if n_extreme_files > 0:
             if file_weight_inst.file_weight < lowest_weighted_files[highest_index][0]:
@@ -438,12 +442,17 @@ def display_local_syntax_info(config: Configuration, ownership: Dict[Contributor
                 highest_weighted_files[lowest_index] = (file_weight_inst.file_weight, file)
                 lowest_index = highest_weighted_files.index(min(highest_weighted_files, key=lambda k: k[0]))
 
-        contributor = get_owner(ownership, file)
+        contributor = ownership.owner(file)
         mult_note = ""
         if file in file_maturity_score:
             file_weight_inst.file_weight *= file_maturity_score[file]
             mult_note = f" adjusted *({file_maturity_score[file]})"
         print(f" - {repo_p(str(file), repo)} -> {WEIGHT} Weight: {file_weight_inst.syntactic_weight}" + mult_note)
+        if line_shares is not None:
+            for line_owner, share in line_shares.get(file, {}).items():
+                per_contributor[line_owner].append(file_weight_inst.syntactic_weight * share)
+                ret[line_owner] += file_weight_inst.syntactic_weight * share
+            continue
         if not contributor:
             continue
         per_contributor[contributor].append(file_weight_inst.syntactic_weight)
@@ -460,13 +469,13 @@ def display_local_syntax_info(config: Configuration, ownership: Dict[Contributor
     if n_extreme_files > 0:
         print(f"{INFO} Highest weighted files:")
         for x in sorted(highest_weighted_files, key=lambda k: k[0], reverse=True):
-            owner = get_owner(ownership, x[1])
+            owner = ownership.owner(x[1])
             name = owner.name if owner is not None else "None"
             print(f" => {repo_p(str(x[1]), repo)} ({x[0]}) by {CONTRIBUTOR}: {name}")
 
         print(f"{INFO} Lowest weighted files:")
         for x in sorted(lowest_weighted_files, key=lambda k: k[0]):
-            owner = get_owner(ownership, x[1])
+            owner = ownership.owner(x[1])
             name = owner.name if owner is not None else "None"
             print(f" => {repo_p(str(x[1]), repo)} ({x[0]}) by {CONTRIBUTOR}: {name}")
 
@@ -474,7 +483,7 @@ def display_local_syntax_info(config: Configuration, ownership: Dict[Contributor
 
 
 def display_sonar_info(config: Configuration, contributors: List[Contributor], repo: Repo,
-                       file_ownership: Dict[Contributor, List[ContributionDistribution]],
+                       file_ownership: FileOwnership,
                        project_key: Optional[str]) -> ContributorWeight:
     '''
     Driver function for SonarQube analysis.
@@ -591,7 +600,7 @@ def display_sonar_info(config: Configuration, contributors: List[Contributor], r
         print(f"{WARN} Severity: {issue_def.severity} --> '{issue_def.message}")
         print(f" -> In file: {repo_p(str(file_path), repo)}:{issue_def.line}")
         if not contributor:
-            contributor = get_owner(file_ownership, file_path)
+            contributor = file_ownership.owner(file_path)
         if not contributor:
             print(f"{WARN} Could not determine who owns this issue. Distributing to all contributors.")
             for c in contributors:
@@ -647,7 +656,7 @@ def display_sonar_info(config: Configuration, contributors: List[Contributor], r
 
 
 def display_semantic_info(tracked_files: List[FileGroup],
-                          ownership: Dict[Contributor, List[ContributionDistribution]],
+                          ownership: FileOwnership,
                           semantics: List[List[Tuple[Path, SemanticWeightModel, 'LangElement']]],
                           file_maturity_score: Dict[Path, float]) \
         -> ContributorWeight:
@@ -669,7 +678,7 @@ def display_semantic_info(tracked_files: List[FileGroup],
             if not group_sem or group_sem[j][1].is_empty:
                 continue
 
-            owner = get_owner(ownership, group.files[j])
+            owner = ownership.owner(group.files[j])
             print(f"File: {group.files[j].name}: Owner: {owner.name if owner is not None else 'None'}")
             structure = group_sem[j][2]
             print(f"Contents: Classes: {len(list(structure.classes))} "
@@ -825,7 +834,7 @@ def get_all_comments(element: LangElement) -> List[LangElement]:
 
 
 def display_constructs_info(tracked_files: List[FileGroup],
-                            ownership: Dict[Contributor, List[ContributionDistribution]],
+                            ownership: FileOwnership,
                             semantic_analysis_grouped_result: List[
                                 List[Tuple[Path, SemanticWeightModel, 'LangElement']]]):
     '''
@@ -840,7 +849,7 @@ def display_constructs_info(tracked_files: List[FileGroup],
         semantic_group = semantic_analysis_grouped_result[i]
         for j in range(len(file_group.files)):
             file = file_group.files[j]
-            owner = get_owner(ownership, file)
+            owner = ownership.owner(file)
             element = semantic_group[j][2]
             for child in element.iterate():
                 if child.kind == 'root':
@@ -857,7 +866,7 @@ def display_constructs_info(tracked_files: List[FileGroup],
 
 
 def display_lines_blanks_comments_info(repository: Repo,
-                                       ownership: Dict[Contributor, List[ContributionDistribution]],
+                                       ownership: FileOwnership,
                                        semantic_analysis_res: List[
                                            List[Tuple[Path, SemanticWeightModel, 'LangElement']]],
                                        tracked_files: List[FileGroup],
@@ -901,12 +910,12 @@ def display_lines_blanks_comments_info(repository: Repo,
     if n_extreme_files > 0:
         print(f"{INFO} Largest files:")
         for x in sorted(largest_files, key=lambda k: k[0], reverse=True):
-            owner = get_owner(ownership, x[1])
+            owner = ownership.owner(x[1])
             name = owner.name if owner is not None else "None"
             print(f" => {repo_p(str(x[1]), repository)} ({x[0]}) by {CONTRIBUTOR}: {name}")
         print(f"{INFO} Smallest files:")
         for x in sorted(smallest_files, key=lambda k: k[0]):
-            owner = get_owner(ownership, x[1])
+            owner = ownership.owner(x[1])
             name = owner.name if owner is not None else "None"
             print(f" => {repo_p(str(x[1]), repository)} ({x[0]}) by {CONTRIBUTOR}: {name}")
 
@@ -966,22 +975,32 @@ def estimate_hours(dates: List[datetime], max_commit_diff: int = 120, first_comm
     return round(hours)
 
 
-def display_hour_estimates(contributors: List[Contributor], repository: Repo) -> Dict[Contributor, Tuple[int, int]]:
+def display_hour_estimates(contributors: List[Contributor], repository: Repo,
+                           commit_range: Optional[CommitRange] = None) -> Dict[Contributor, Tuple[int, int]]:
     '''
     Driver function for hour estimates
+
+    :param commit_range: Commits are read from its commit table, without it they are read from the repository
     '''
 
     header(f"{TIME} Hour estimates:", machine_id="hours")
 
-    commits = [x for x in repository.iter_commits()]
-
     commits_by_author = defaultdict(lambda: [])
 
-    for commit in commits:
-        if commit.author.name is None:
-            continue
-        c = find_contributor(contributors, commit.author.name)
-        commits_by_author[c].append(commit.committed_datetime)
+    if commit_range is not None:
+        commit_table = commit_range.commit_table
+        for commit_hash in commit_table.ancestors(repository.head.commit.hexsha):
+            author = commit_table.author(commit_hash)
+            if author.name is None:
+                continue
+            c = find_contributor(contributors, author.name)
+            commits_by_author[c].append(commit_table.committed_datetime(commit_hash))
+    else:
+        for commit in repository.iter_commits():
+            if commit.author.name is None:
+                continue
+            c = find_contributor(contributors, commit.author.name)
+            commits_by_author[c].append(commit.committed_datetime)
 
     ret: Dict[Contributor, Tuple[int, int]] = {}
 
@@ -1131,6 +1150,7 @@ def main(arguments: argparse.Namespace) -> None:
         config.sonarqube_port = arguments.sq_port
         config.machine_preprocessed_output = arguments.machine_output
         config.no_graphs = arguments.no_graphs
+        config.line_syntax_attribution = arguments.line_syntax_attribution
         
 
         config.ignore_whitespace_changes = arguments.ignore_whitespace_changes
@@ -1158,13 +1178,24 @@ def main(arguments: argparse.Namespace) -> None:
 
     project_key, container = start_sonar_analysis(config, repository_path)
 
-    tracked_files = get_tracked_files(repository, verbose=True)
-    history_analysis_result = commit_range.analyze(verbose=True)
-    syntactic_analysis_result = local_syntax_analysis(config, tracked_files)
+    # Contents of the files at <head> are read from the object database, the working tree is not used at all
+    commit_files = CommitFiles(repository, commit_range.head, commit_range.objects) if arguments.no_checkout else None
+    tracked_files = get_tracked_files(repository, verbose=True, commit_files=commit_files)
+    if arguments.run_length_ownership:
+        commit_range.line_ownership = RunLengthLineOwnership
+    cache_dir = Path(arguments.ownership_cache) if arguments.ownership_cache else None
+    history_analysis_result = commit_range.analyze(config, verbose=True, streaming=arguments.stream_history,
+                                                   cache_dir=cache_dir, jobs=arguments.jobs,
+                                                   pipeline_depth=arguments.pipeline_depth,
+                                                   blame_workers=arguments.blame_jobs, ignore=ignore_matcher())
+    syntax_cache_dir = Path(arguments.syntax_cache) if arguments.syntax_cache else None
+    syntactic_analysis_result = local_syntax_analysis(config, tracked_files, commit_files, arguments.syntax_jobs,
+                                                      syntax_cache_dir)
     file_history_multiplier = file_analyzer.assign_scores(tracked_files, history_analysis_result, config)
 
     semantic_analysis_grouped_result = semantic_analysis.compute_semantic_weight_result(config, tracked_files,
-                                                                                        verbose=True)
+                                                                                        verbose=True,
+                                                                                        commit_files=commit_files)
     # separator()
     base_file_path = Path(arguments.file).parent if arguments.file else None
     if base_file_path:
@@ -1198,7 +1229,8 @@ def main(arguments: argparse.Namespace) -> None:
     separator(section_end=True)
 
     local_syntax_weights = display_local_syntax_info(config, ownership, syntactic_analysis_result, repository,
-                                                     file_history_multiplier)
+                                                     file_history_multiplier, contributors=contributors,
+                                                     history_analysis=history_analysis_result)
     separator(section_end=True)
 
     semantic_weights = display_semantic_info(tracked_files, ownership, semantic_analysis_grouped_result,
@@ -1208,7 +1240,7 @@ def main(arguments: argparse.Namespace) -> None:
     display_constructs_info(tracked_files, ownership, semantic_analysis_grouped_result)
     separator(section_end=True)
 
-    hours = display_hour_estimates(contributors, repository)
+    hours = display_hour_estimates(contributors, repository, commit_range)
     hour_weights = gaussian_weights(config, arguments.hour_estimate_per_contributor, hours)
     separator(section_end=True)
 
@@ -1271,6 +1303,35 @@ if __name__ == '__main__':
                              'places separators between sections and separators between items in a section')
     parser.add_argument('--no-graphs', action='store_true', default=False,
                         help='Do not display graphs.')
+    parser.add_argument('--stream-history', action='store_true', default=False,
+                        help='Replay the commit history from a single streamed "git log" process '
+                             'instead of diffing each commit separately.')
+    parser.add_argument('--ownership-cache', type=str, default='', metavar="PATH",
+                        help='Directory for ownership snapshots, a later run only analyzes commits added since.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                        help='Number of processes replaying the history of files, files are split between processes.')
+    parser.add_argument('--pipeline-depth', type=int, default=0, metavar='N',
+                        help='Obtain the changes of up to N commits ahead in background threads while replaying, '
+                             '0 disables it. Has no effect with --stream-history.')
+    parser.add_argument('--blame-jobs', type=int, default=8, metavar='N',
+                        help='Number of threads blaming the files that exist before the first analyzed commit, '
+                             'used when the analysis does not start from the first commit.')
+    parser.add_argument('--run-length-ownership', action='store_true', default=False,
+                        help='Store line ownership as runs of lines with the same author, '
+                             'uses less memory for large generated or vendored files.')
+    parser.add_argument('--syntax-jobs', type=int, default=1, metavar='N',
+                        help='Number of processes computing the syntactic weight of files, '
+                             'files are sent to the processes in batches.')
+    parser.add_argument('--syntax-cache', type=str, default='', metavar="PATH",
+                        help='Directory for syntactic weights of files, files with the same contents as in a previous '
+                             'run are not weighted again.')
+    parser.add_argument('--line-syntax-attribution', action='store_true', default=False,
+                        help='Split the syntactic weight of a file between the owners of its lines by the weight of '
+                             'the lines, instead of giving it to the owner of the whole file.')
+    parser.add_argument('--no-checkout', action='store_true', default=False,
+                        help='Read the files at --head from the git object database instead of the working tree, '
+                             'no checkout is needed and bare repositories can be analyzed. '
+                             'SonarQube still analyzes the working tree.')
     parser.add_argument('--prescan-mode', action='store_true', default=False,
                         help='Display only pre-scan information, such as contributors and commit range. '
                         'Used for further tuning of the configuration.')
@@ -2,12 +2,15 @@
 File responsible for analyzing the semantics of a programming language.
 '''
 
+import os
 import subprocess
+import tempfile
 import time
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple, Iterator
 
 from configuration import Configuration
+from history_analyzer import CommitFiles
 from lib import FileGroup
 from semantic_weight_model import SemanticWeightModel
 from uni_chars import *
@@ -16,6 +19,9 @@ LANG_SEMANTICS_PATH = Path(__file__).parent / "lang-semantics"
 
 SEMANTIC_ANALYZERS: Dict[str, 'LangSemantics'] = {}
 
+# Files read from the object database are written here for the analyzers, which only accept paths. tmpfs if available
+MATERIALIZE_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
 
 class LangElement:
     '''
@@ -184,11 +190,13 @@ def compute_semantic_weight(file: Path) -> Tuple[Path, SemanticWeightModel, 'Lan
     return semantics.analyze([file])[0]
 
 
-def compute_semantic_weight_grouped(config: Configuration, file_group: FileGroup) \
+def compute_semantic_weight_grouped(config: Configuration, file_group: FileGroup,
+                                    commit_files: Optional[CommitFiles] = None) \
         -> List[Tuple[Path, SemanticWeightModel, 'LangElement']]:
     '''
     Computes the semantic weight for a group of files.
     Individual files are grouped by extension per folder to speed up the process.
+    When <commit_files> are given, the files are read from that commit and materialized in `MATERIALIZE_DIR`.
     '''
 
     files = [file.absolute() for file in file_group.files]
@@ -215,14 +223,21 @@ def compute_semantic_weight_grouped(config: Configuration, file_group: FileGroup
                       f" /OR/ "
                       f"add the extension to `config.ignored_extensions` or via the `--ignored-extensions` flag.")
                 exit(1)
-            unsorted_ret.extend(semantics.analyze(files))
+            if commit_files is None:
+                unsorted_ret.extend(semantics.analyze(files))
+                continue
+            with tempfile.TemporaryDirectory(prefix='mura-', dir=MATERIALIZE_DIR) as directory:
+                materialized = commit_files.materialize(files, Path(directory))
+                for file, model, element in semantics.analyze(list(materialized)):
+                    unsorted_ret.append((materialized[file], model, element))
 
     unsorted_ret.sort(key=lambda x: file_group.files.index(x[0]))
 
     return unsorted_ret
 
 
-def compute_semantic_weight_result(config: Configuration, file_groups: List[FileGroup], verbose=False) \
+def compute_semantic_weight_result(config: Configuration, file_groups: List[FileGroup], verbose=False,
+                                   commit_files: Optional[CommitFiles] = None) \
         -> List[List[Tuple[Path, SemanticWeightModel, 'LangElement']]]:
     '''
     Driver function for the semantic analysis.
@@ -233,7 +248,7 @@ def compute_semantic_weight_result(config: Configuration, file_groups: List[File
     start = time.time()
     ret = []
     for group in file_groups:
-        grouped_semantic_weight = compute_semantic_weight_grouped(config, group)
+        grouped_semantic_weight = compute_semantic_weight_grouped(config, group, commit_files)
         ret.append(grouped_semantic_weight)
         progress = time.time()
         if verbose:
@@ -3,7 +3,8 @@ File used for the SyntacticWeightModel class, which is used to store the weights
 '''
 
 import re
-from typing import List, TextIO
+from collections import defaultdict
+from typing import List, TextIO, Dict, Optional, Pattern, Union
 
 import Levenshtein
 
@@ -30,9 +31,69 @@ class SyntacticWeightModel:
                 return self.regex_pattern.match(line) is not None
             return False  # Undefined case
 
+    class LiteralMatcher:
+        '''
+        Consecutive literal entries compiled together.
+        Entries allowing no modification are found by a dictionary lookup, the others are only compared with lines
+        whose length differs from the pattern by at most their match distance.
+        '''
+        def __init__(self, entries: List['SyntacticWeightModel.Entry']) -> None:
+            self.entries = entries
+            self.exact: Dict[str, int] = {}
+            self.fuzzy_by_length: Dict[int, List[int]] = defaultdict(list)
+            self.max_distance = 0
+            for i, entry in enumerate(entries):
+                if 0 <= entry.match_distance < 1:
+                    self.exact.setdefault(entry.pattern, i)
+                elif entry.match_distance >= 1:
+                    self.fuzzy_by_length[len(entry.pattern)].append(i)
+                    self.max_distance = max(self.max_distance, int(entry.match_distance))
+
+        def match(self, line: str) -> Optional['SyntacticWeightModel.Entry']:
+            first = self.exact.get(line, len(self.entries))
+            if self.fuzzy_by_length:
+                length = len(line)
+                candidates = sorted(i for bucket in range(length - self.max_distance, length + self.max_distance + 1)
+                                    for i in self.fuzzy_by_length.get(bucket, ()))
+                for i in candidates:
+                    if i > first:
+                        break
+                    entry = self.entries[i]
+                    if abs(len(entry.pattern) - length) <= entry.match_distance and entry.matches(line):
+                        return entry
+            return self.entries[first] if first < len(self.entries) else None
+
+    class RegexMatcher:
+        '''
+        Consecutive regex entries fused into a single alternation, every entry is a named group.
+        An alternation tries its branches in order, the first entry that matches is therefore the one reported.
+        Patterns which can not be fused (e.g. using backreferences) are matched one by one.
+        '''
+        def __init__(self, entries: List['SyntacticWeightModel.Entry']) -> None:
+            self.entries = entries
+            self.fused: Optional[Pattern[str]] = None
+            try:
+                self.fused = re.compile('|'.join(f'(?P<e{i}>{entry.pattern})' for i, entry in enumerate(entries)))
+            except re.error:
+                pass
+            if self.fused is not None and any(re.search(r'\\[1-9]|\(\?P=', entry.pattern) for entry in entries):
+                # Numbered and named backreferences would point to different groups once fused
+                self.fused = None
+
+        def match(self, line: str) -> Optional['SyntacticWeightModel.Entry']:
+            if self.fused is None:
+                return next((entry for entry in self.entries if entry.matches(line)), None)
+            match = self.fused.match(line)
+            if match is None:
+                return None
+            assert match.lastgroup is not None
+            return self.entries[int(match.lastgroup[1:])]
+
     def __init__(self):
         self.base_weight = 1
         self.weights: List[SyntacticWeightModel.Entry] = []
+        self._matchers: Optional[List[Union[SyntacticWeightModel.LiteralMatcher,
+                                            SyntacticWeightModel.RegexMatcher]]] = None
 
     def load_literals(self, file: TextIO):
         for line in file.readlines():
@@ -44,6 +105,7 @@ class SyntacticWeightModel:
             exactness = float(split[1])
             pattern = split[2]
             self.weights.append(SyntacticWeightModel.Entry(PatternType.LITERAL, pattern, exactness, weight))
+        self._matchers = None
 
     def load_regex(self, file: TextIO):
         for line in file:
@@ -54,11 +116,30 @@ class SyntacticWeightModel:
             pattern = split[1].strip()
             assert pattern.startswith('"') and pattern.endswith('"'), f"Patterns must be enclosed in \"\"! - {pattern}"
             self.weights.append(SyntacticWeightModel.Entry(PatternType.REGEX, pattern[1:-1], 0, float(split[0])))
+        self._matchers = None
 
+    def compile(self) -> None:
+        '''
+        Groups consecutive entries of the same type into matchers, done once after the weights are loaded.
+        '''
+        self._matchers = []
+        start = 0
+        for end in range(1, len(self.weights) + 1):
+            if end == len(self.weights) or self.weights[end].pattern_type != self.weights[start].pattern_type:
+                entries = self.weights[start:end]
+                if entries[0].pattern_type == PatternType.LITERAL:
+                    self._matchers.append(SyntacticWeightModel.LiteralMatcher(entries))
+                else:
+                    self._matchers.append(SyntacticWeightModel.RegexMatcher(entries))
+                start = end
 
     def get_weight(self, line: str, line_stripped: str) -> float:
-        for key in self.weights:
-            if key.pattern_type == PatternType.REGEX and key.matches(line) or \
-               key.pattern_type == PatternType.LITERAL and key.matches(line_stripped):
-                return key.weight
+        if self._matchers is None:
+            self.compile()
+        assert self._matchers is not None
+        for matcher in self._matchers:
+            # Regexes are matched against the whole line, literals against the stripped line
+            entry = matcher.match(line if isinstance(matcher, SyntacticWeightModel.RegexMatcher) else line_stripped)
+            if entry is not None:
+                return entry.weight
         return self.base_weight
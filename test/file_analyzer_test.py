@@ -1,3 +1,4 @@
+import tempfile
 import unittest
 import uuid
 from datetime import datetime
@@ -7,9 +8,12 @@ from typing import Dict
 import git
 
 from configuration import Configuration
-from file_analyzer import assign_scores, group_by_common_suffix, convert_file_groups
+from file_analyzer import assign_scores, group_by_common_suffix, convert_file_groups, compute_syntactic_weight, \
+    compute_syntactic_weights, SyntacticWeightCache, FileWeight, line_weight_shares
 from history_analyzer import CommitRange, Ownership
-from lib import FileGroup
+from lib import FileGroup, IgnoreMatcher, Contributor
+from pattern_type import PatternType
+from syntactic_weight_model import SyntacticWeightModel
 
 repos_path = "../repositories"
 single_commit = repos_path + "\\single_commit"
@@ -326,5 +330,110 @@ class FileAnalyzerTest(unittest.TestCase):
             self.assertTrue(result == expected_result, f'Expected {expected_result}, but got {result}')
 
 
+    def test_ignore_matcher(self):
+        matcher = IgnoreMatcher(['# comment', 'bin/', '*.class', '/out/', '.vscode/*', '!.vscode/settings.json'])
+
+        self.assertTrue(matcher.matches('bin/Main.java'))
+        self.assertTrue(matcher.matches('project/bin/Main.java'))
+        self.assertTrue(not matcher.matches('project/bin'))
+        self.assertTrue(matcher.matches('project/Main.class'))
+        self.assertTrue(matcher.matches('out/Main.java'))
+        self.assertTrue(not matcher.matches('project/out/Main.java'))
+        self.assertTrue(matcher.matches('.vscode/launch.json'))
+        self.assertTrue(not matcher.matches('.vscode/settings.json'))
+        self.assertTrue(matcher.matches('bin/.vscode/settings.json'))
+
+    def test_compiled_weight_model(self):
+        model = SyntacticWeightModel()
+        model.weights = [
+            SyntacticWeightModel.Entry(PatternType.LITERAL, '}', 0, 0.1),
+            SyntacticWeightModel.Entry(PatternType.LITERAL, 'else {', 1, 0.2),
+            SyntacticWeightModel.Entry(PatternType.REGEX, r'\s*import .*;', 0, 0.3),
+            SyntacticWeightModel.Entry(PatternType.REGEX, r'\s*import static .*;', 0, 0.4),
+            SyntacticWeightModel.Entry(PatternType.LITERAL, '{', 0, 0.5),
+        ]
+        lines = ['}', '} ', 'else {', 'else{', 'els {', '  import static a.B;', 'import a;', '{', '  {', 'other']
+
+        for line in lines:
+            expected = next((entry.weight for entry in model.weights
+                             if entry.matches(line if entry.pattern_type == PatternType.REGEX else line.strip())),
+                            model.base_weight)
+            self.assertTrue(model.get_weight(line, line.strip()) == expected)
+
+    def test_compute_syntactic_weights_in_processes(self):
+        config = Configuration()
+        files = [Path('../lang-semantics/java/testfile.java'), Path('../README.md'),
+                 Path('../lang-semantics/cs/testfile.cs'),
+                 Path('../lang-semantics/java/java-ast/src/main/java/cz/muni/fi/javaast/App.java')]
+
+        weights = compute_syntactic_weights(files, config, jobs=2, chunk_size=1)
+
+        self.assertTrue(weights[1] is None)
+        for file, weight in zip(files, weights):
+            expected = compute_syntactic_weight(file, config)
+            self.assertTrue((weight is None) == (expected is None))
+            if weight is not None:
+                self.assertTrue(weight.file == file)
+                self.assertTrue(weight.line_weights == expected.line_weights)
+
+    def test_syntactic_weight_cache(self):
+        config = Configuration()
+        files = [Path('../lang-semantics/java/testfile.java'), Path('../lang-semantics/cs/testfile.cs')]
+        expected = compute_syntactic_weights(files, config)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = SyntacticWeightCache(Path(cache_dir), config, max_entries=1)
+            compute_syntactic_weights(files, config, cache=cache)
+            self.assertTrue(cache.hits == 0)
+            cache.save()
+
+            cache = SyntacticWeightCache(Path(cache_dir), config, max_entries=1)
+            weights = compute_syntactic_weights(files, config, cache=cache)
+            # Only the most recently used weight is kept
+            self.assertTrue(cache.hits == 1)
+            self.assertTrue([w.line_weights for w in weights] == [w.line_weights for w in expected])
+            self.assertTrue(weights[1].file == files[1])
+
+            config.max_line_length = 10
+            cache = SyntacticWeightCache(Path(cache_dir), config, max_entries=1)
+            compute_syntactic_weights(files, config, cache=cache)
+            self.assertTrue(cache.hits == 0)
+
+    def test_line_weight_shares(self):
+        with tempfile.TemporaryDirectory() as repo_dir:
+            repo = git.Repo.init(repo_dir)
+            file = Path(repo_dir) / 'Main.java'
+            file.write_text('a\nb\n')
+            repo.index.add(['Main.java'])
+            repo.index.commit('Initial', author=git.Actor('A', 'a@a.cz'))
+            file.write_text('a\nb\nc\nd\n')
+            repo.index.add(['Main.java'])
+            repo.index.commit('Append', author=git.Actor('B', 'b@b.cz'))
+
+            result = CommitRange(repo, 'HEAD', 'ROOT').analyze()
+            repo.close()
+
+        a, b = Contributor('A', 'a@a.cz'), Contributor('B', 'b@b.cz')
+        # The second weight is a penalty for a long line, it belongs to the line 'b'
+        file_weight = FileWeight(file, 5.0, [1.0, -1.0, 1.0, 0.5, 0.5], [1])
+        self.assertTrue(file_weight.weights_per_line().tolist() == [1.0, 0.0, 0.5, 0.5])
+
+        shares = line_weight_shares([a, b], {file: file_weight}, result)
+        self.assertTrue(shares[file][a] == 0.5)
+        self.assertTrue(shares[file][b] == 0.5)
+
+    def test_group_by_common_suffix_same_stems(self):
+        paths = [Path('a/UserDTO.java'), Path('b/UserDTO.java'), Path('AddUserDTO.java'), Path('Main.java'),
+                 Path('Main.java'), Path('Model.cs'), Path('Label.cs')]
+
+        res = group_by_common_suffix(paths)
+
+        self.assertTrue(res == {
+            'UserDTO': [Path('a/UserDTO.java'), Path('b/UserDTO.java'), Path('AddUserDTO.java')],
+            '': [Path('Main.java'), Path('Main.java')],
+            'el': [Path('Model.cs'), Path('Label.cs')],
+        })
+        self.assertTrue(list(res) == ['UserDTO', '', 'el'])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,76 @@
+'''
+Benchmark of `group_by_common_suffix` against the pairwise comparison it replaced.
+Run from this directory with the repository root on the PYTHONPATH, e.g. `PYTHONPATH=.. python <this file>`.
+'''
+import random
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+from file_analyzer import group_by_common_suffix
+
+PREFIXES = ['Add', 'Update', 'Delete', 'Get', 'List', 'Create', 'Abstract', 'Default', 'Base', 'Test']
+SUFFIXES = ['Controller', 'Service', 'Repository', 'DTO', 'Model', 'View', 'Test', 'Factory', 'Handler', '']
+EXTENSIONS = ['.java', '.cs', '.py', '.txt']
+
+# The pairwise comparison is only timed up to this number of files, it takes minutes beyond that
+PAIRWISE_LIMIT = 2000
+
+
+def pairwise_group_by_common_suffix(paths: List[Path]) -> Dict[str, List[Path]]:
+    '''
+    The previous implementation, every stem is compared with every other stem.
+    '''
+    result = defaultdict(list)
+    for path1 in paths:
+        stem1 = path1.stem
+        max_common_suffix = ''
+        for path2 in paths:
+            if path1 == path2:
+                continue
+            stem2 = path2.stem
+            min_len = min(len(stem1), len(stem2))
+            common_suffix = ''
+            for i in range(min_len):
+                char = stem1[-i - 1]
+                if stem2[-i - 1] == char:
+                    common_suffix = char + common_suffix
+                else:
+                    break
+            if len(common_suffix) > len(max_common_suffix):
+                max_common_suffix = common_suffix
+        result[max_common_suffix].append(path1)
+    return dict(result)
+
+
+def generate_paths(count: int, rng: random.Random) -> List[Path]:
+    ret = []
+    for i in range(count):
+        name = rng.choice(PREFIXES) + f"Entity{rng.randrange(count)}" + rng.choice(SUFFIXES)
+        ret.append(Path(f"src/module{i % 50}") / (name + rng.choice(EXTENSIONS)))
+    return ret
+
+
+def measure(function, paths: List[Path]):
+    start = time.perf_counter()
+    result = function(paths)
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    rng = random.Random(42)
+    print(f"{'files':>8} {'sorted [s]':>12} {'pairwise [s]':>14}")
+    for count in [250, 500, 1000, 2000, 5000, 10000, 50000]:
+        paths = generate_paths(count, rng)
+        sorted_time, result = measure(group_by_common_suffix, paths)
+        pairwise = '-'
+        if count <= PAIRWISE_LIMIT:
+            pairwise_time, expected = measure(pairwise_group_by_common_suffix, paths)
+            assert result == expected and list(result) == list(expected), "Groupings differ!"
+            pairwise = f"{pairwise_time:.3f}"
+        print(f"{count:>8} {sorted_time:>12.3f} {pairwise:>14}")
+
+
+if __name__ == '__main__':
+    main()
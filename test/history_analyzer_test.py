@@ -1,4 +1,5 @@
 import datetime
+import tempfile
 import unittest
 from math import isclose
 from pathlib import Path
@@ -7,8 +8,10 @@ from typing import List
 import git
 
 import lib
+from configuration import Configuration
 from environment_local import TURTLE_GRAPHICS_REPO
-from history_analyzer import get_file_changes, AuthorName, CommitRange, calculate_percentage, LineMetadata
+from history_analyzer import get_file_changes, AuthorName, CommitRange, calculate_percentage, LineMetadata, \
+    LineOwnership, RunLengthLineOwnership, blame_file, CommitFiles
 
 TEST_REPO2 = Path("..\\repositories\\single_file")
 TEST_REPO_UNMERGED = Path("..\\repositories\\unmerged")
@@ -41,6 +44,84 @@ class HistoryAnalyzerTest(unittest.TestCase):
         self.assertNotIn('eeb0d000e34557eca920fee01631bf26cfaea8f4', path)
         self.assertIn('cdce762b1f46fc20c1e15c27c7874925ff830ab4', path)
 
+    def test_commit_range_membership(self):
+        hist = 'cdce762b1f46fc20c1e15c27c7874925ff830ab4'
+        head = '2dee9480a4d9aff4c006467d4c4a61b7ff7b9871'
+
+        c_range = CommitRange(git.Repo(TURTLE_GRAPHICS_REPO), head, hist)
+        path = c_range.compute_path()
+
+        self.assertTrue(list(c_range) == list(path))
+        self.assertTrue(len(c_range) == len(path))
+        self.assertTrue(c_range.index(hist) == 0)
+        self.assertIn('b26a115358829a74748b37c4f082c3ac962a3852', c_range)
+        self.assertNotIn('dbc9cd68af1402c8803e17fb292dcaf936e6d279', c_range)
+        self.assertTrue(c_range.commit(head) is c_range.commit(head))
+
+    def test_commit_table(self):
+        repo = git.Repo(TURTLE_GRAPHICS_REPO)
+        c_range = CommitRange(repo, '2dee9480a4d9aff4c006467d4c4a61b7ff7b9871', 'ROOT')
+
+        for commit_hash in c_range:
+            commit = repo.commit(commit_hash)
+            self.assertTrue(c_range.author(commit_hash) == commit.author)
+            self.assertTrue(c_range.commit_table.committed_datetime(commit_hash) == commit.committed_datetime)
+            self.assertTrue(c_range.commit_table.summary(commit_hash) == commit.message.splitlines()[0])
+
+    def test_commit_stats(self):
+        repo = git.Repo(TURTLE_GRAPHICS_REPO)
+        c_range = CommitRange(repo, '2dee9480a4d9aff4c006467d4c4a61b7ff7b9871', 'ROOT')
+
+        for commit_hash in c_range:
+            commit = repo.commit(commit_hash)
+            stats = c_range.commit_stats[commit_hash]
+            self.assertTrue(stats.insertions == commit.stats.total['insertions'])
+            self.assertTrue(stats.deletions == commit.stats.total['deletions'])
+            if commit.parents:
+                modified = [diff for diff in commit.parents[0].diff(commit) if diff.change_type == 'M']
+                self.assertTrue(len(stats.flags['M']) == len(modified))
+
+    def test_analyze_parallel_matches_sequential(self):
+        repo = git.Repo(TURTLE_GRAPHICS_REPO)
+        c_range = CommitRange(repo, '2dee9480a4d9aff4c006467d4c4a61b7ff7b9871', 'ROOT')
+        result = c_range.analyze()
+        parallel = c_range.analyze(jobs=4)
+
+        self.assertTrue(list(result.keys()) == list(parallel.keys()))
+        for file, ownership in result.items():
+            self.assertTrue(ownership.changes == parallel[file].changes)
+            self.assertTrue(list(ownership.history.keys()) == list(parallel[file].history.keys()))
+
+    def test_analyze_pipelined_matches_sequential(self):
+        repo = git.Repo(TURTLE_GRAPHICS_REPO)
+        c_range = CommitRange(repo, '2dee9480a4d9aff4c006467d4c4a61b7ff7b9871', 'ROOT')
+        result = c_range.analyze()
+        pipelined = c_range.analyze(pipeline_depth=8, pipeline_workers=2)
+
+        self.assertTrue(list(result.keys()) == list(pipelined.keys()))
+        for file, ownership in result.items():
+            self.assertTrue(ownership.changes == pipelined[file].changes)
+
+    def test_object_reader(self):
+        repo = git.Repo(TEST_REPO2)
+        commit = 'aa1b0d3dd95ffcbbd0827f147a912888a5ced8bd'
+        c_range = CommitRange(repo, commit, 'ROOT')
+
+        content = c_range.objects.read(f'{commit}:NasModel.cs')
+
+        self.assertTrue(c_range.objects.size(f'{commit}:NasModel.cs') == len(content))
+        self.assertTrue(c_range.checkout_file_from(commit, 'NasModel.cs') == repo.git.show(f'{commit}:NasModel.cs'))
+        self.assertRaises(ValueError, lambda: c_range.objects.read(f'{commit}:missing.txt'))
+
+    def test_blame_file(self):
+        repo = git.Repo(TEST_REPO2)
+        commit = 'aa1b0d3dd95ffcbbd0827f147a912888a5ced8bd'
+
+        blamed_lines = blame_file(str(repo.working_dir), commit, 'NasModel.cs')
+        expected = [(c.author.name, str(line)) for c, lines in repo.blame(commit, 'NasModel.cs') for line in lines]
+
+        self.assertTrue(blamed_lines == expected)
+
     def test_get_ownership(self):
         c_hash = '9d5b319e1302d4bfa79b44c639b1c7de82d6a9c7'
         repo = git.Repo(TEST_REPO2)
@@ -96,6 +177,75 @@ class HistoryAnalyzerTest(unittest.TestCase):
         self.assertTrue(by(result[self.nas_model].changes[76:76 + 7], "Other Name"))
         self.assertTrue(by(result[self.nas_model].changes[83:85], "Michal-MK"))
 
+    def test_analyze_streaming_matches_default(self):
+        repo = git.Repo(TEST_REPO2)
+        lib.try_checkout(repo, 'aa1b0d3dd95ffcbbd0827f147a912888a5ced8bd', True)
+        c_range = CommitRange(repo, 'HEAD', 'ROOT')
+        result = c_range.analyze()
+        streamed = c_range.analyze(streaming=True)
+
+        self.assertTrue(result.keys() == streamed.keys())
+        self.assertTrue(streamed[self.nas_model].line_count == 85)
+        self.assertTrue(list(map(lambda x: x.author, result[self.nas_model].changes)) ==
+                        list(map(lambda x: x.author, streamed[self.nas_model].changes)))
+
+    def test_analyze_incremental_snapshot(self):
+        repo = git.Repo(TEST_REPO2)
+        lib.try_checkout(repo, 'aa1b0d3dd95ffcbbd0827f147a912888a5ced8bd', True)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            CommitRange(repo, '9d5b319e1302d4bfa79b44c639b1c7de82d6a9c7', 'ROOT').analyze(cache_dir=Path(cache_dir))
+            result = CommitRange(repo, 'HEAD', 'ROOT').analyze(cache_dir=Path(cache_dir))
+
+        self.assertTrue(result[self.nas_model].line_count == 85)
+        self.assertTrue(by(result[self.nas_model].changes[76:76 + 7], "Other Name"))
+
+    def test_analyze_skips_ignored_files(self):
+        with tempfile.TemporaryDirectory() as repo_dir:
+            repo = git.Repo.init(repo_dir)
+            (Path(repo_dir) / 'bin').mkdir()
+            (Path(repo_dir) / 'bin' / 'Main.class').write_text('a\nb\n')
+            (Path(repo_dir) / 'Main.java').write_text('a\nb\n')
+            repo.index.add(['bin/Main.class', 'Main.java'])
+            repo.index.commit('Initial', author=git.Actor('A', 'a@a.cz'))
+
+            result = CommitRange(repo, 'HEAD', 'ROOT').analyze(ignore=lib.IgnoreMatcher(['bin/']))
+            repo.close()
+
+        self.assertTrue([file.name for file in result] == ['Main.java'])
+
+    def test_commit_files(self):
+        with tempfile.TemporaryDirectory() as repo_dir:
+            repo = git.Repo.init(repo_dir)
+            file = Path(repo_dir) / 'src' / 'Main.java'
+            file.parent.mkdir()
+            file.write_text('a\nb\n')
+            repo.index.add(['src/Main.java'])
+            commit = repo.index.commit('Initial', author=git.Actor('A', 'a@a.cz')).hexsha
+            file.write_text('changed\n')
+
+            commit_files = CommitFiles(repo, commit)
+            groups = lib.get_tracked_files(repo, commit_files=commit_files)
+            content = commit_files.open(file).readlines()
+            commit_files.objects.close()
+            repo.close()
+
+        self.assertTrue(content == ['a\n', 'b\n'])
+        self.assertTrue([group.files for group in groups] == [[file]])
+
+    def test_history_reconstructs_content(self):
+        repo = git.Repo(TEST_REPO2)
+        lib.try_checkout(repo, 'aa1b0d3dd95ffcbbd0827f147a912888a5ced8bd', True)
+        c_range = CommitRange(repo, 'HEAD', 'ROOT')
+        result = c_range.analyze()
+
+        ownership = result[self.nas_model]
+        last = list(ownership.history.values())[-1]
+
+        self.assertTrue(last.content == ownership.changes)
+        self.assertTrue(all(map(lambda x: x.size == sum(len(line.content) for line in x.content),
+                                ownership.history.values())))
+        self.assertTrue(all(map(lambda x: x.line_count == len(x.content), ownership.history.values())))
+
     def test_analyze_percentage(self):
         repo = git.Repo(TEST_REPO2)
         lib.try_checkout(repo, 'aa1b0d3dd95ffcbbd0827f147a912888a5ced8bd', True)
@@ -109,6 +259,84 @@ class HistoryAnalyzerTest(unittest.TestCase):
         self.assertTrue(isclose(percentage.global_contribution[contributors[0]], 77 / 84))
         self.assertTrue(isclose(percentage.global_contribution[contributors[1]], 7 / 84))
 
+    def test_get_contributors_merges_aliases(self):
+        class Range:
+            authors = [git.Actor('Jiří', 'jiri@a.cz'), git.Actor('Jiri', 'jiri@b.cz'), git.Actor('Jiří', 'jiri@c.cz'),
+                       git.Actor('JK', 'jiri@c.cz'), git.Actor('Other', 'other@a.cz'), git.Actor('Mapped', 'm@a.cz')]
+
+            def __iter__(self):
+                return iter(range(len(self.authors)))
+
+            def author(self, index):
+                return self.authors[index]
+
+        config = Configuration()
+        config.contributor_map = [('Other', 'Mapped')]
+        contributors = lib.get_contributors(config, Range())
+
+        self.assertTrue(len(contributors) == 3)
+        self.assertTrue(contributors[0].name == 'Jiří')
+        self.assertTrue(lib.find_contributor(contributors, 'JK') is contributors[0])
+        self.assertTrue(lib.find_contributor(contributors, 'jiri@b.cz') is contributors[0])
+        self.assertTrue(lib.find_contributor(contributors, 'm@a.cz') is contributors[1])
+        self.assertTrue(lib.find_contributor(contributors, 'Nobody') is None)
+        self.assertTrue(hash(contributors[0]) != hash(contributors[1]))
+        self.assertTrue({contributors[0]: 1}.get(contributors[0].aliases[-1]) == 1)
+
+        # Contributors of another resolution are different even when they have the same position
+        other = lib.get_contributors(Configuration(), Range())
+        self.assertTrue(other[0] != contributors[0])
+        ad_hoc = lib.Contributor(contributors[0].name, contributors[0].email)
+        self.assertTrue(ad_hoc != contributors[0])
+        self.assertTrue(ad_hoc == lib.Contributor(ad_hoc.name, ad_hoc.email))
+        self.assertTrue(hash(ad_hoc) == hash(lib.Contributor(ad_hoc.name, ad_hoc.email)))
+
+    def test_contribution_matrix(self):
+        contributors = [lib.Contributor('A', 'a'), lib.Contributor('B', 'b')]
+        matrix = lib.ContributionMatrix(contributors)
+        matrix.add_file(Path('x'), 10)
+        matrix.add(Path('x'), 0, 9)
+        matrix.add(Path('x'), 1, 1)
+        matrix.add_file(Path('y'), 10)
+        matrix.add(Path('y'), 1, 5)
+
+        percentage = matrix.percentage()
+        ownership = matrix.file_ownership(0.8)
+
+        self.assertTrue(percentage.file_per_contributor[Path('y')] == [(contributors[1], 0.5)])
+        self.assertTrue(isclose(percentage.global_contribution[contributors[0]], 9 / 20))
+        self.assertTrue(ownership.owner(Path('x')) is contributors[0])
+        self.assertTrue(ownership.owner(Path('y')) is None)
+
+    def test_line_ownership_tracks_modified_lines(self):
+        date = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+        lines = LineOwnership.of('A', date, ['a\n', 'b\n', 'c\n', 'd\n'])
+        lines.take_modified()
+
+        lines[1:3] = LineOwnership.of('B', date, ['x\n'])
+        lines.insert(0, LineMetadata('C', 'y\n', date))
+
+        self.assertTrue(list(map(lambda x: x.author, lines)) == ['C', 'A', 'B', 'A'])
+        self.assertTrue(lines.size == 8)
+        self.assertTrue(lines.pop(1).content == 'a\n')
+
+        start, removed, inserted = lines.take_modified()
+        self.assertTrue((start, removed) == (0, 3))
+        self.assertTrue(inserted.contents == ['y\n', 'x\n'])
+
+    def test_run_length_ownership_matches_default(self):
+        repo = git.Repo(TEST_REPO2)
+        lib.try_checkout(repo, 'aa1b0d3dd95ffcbbd0827f147a912888a5ced8bd', True)
+        c_range = CommitRange(repo, 'HEAD', 'ROOT')
+        result = c_range.analyze()
+        c_range.line_ownership = RunLengthLineOwnership
+        runs = c_range.analyze()
+
+        self.assertTrue(isinstance(runs[self.nas_model].changes, RunLengthLineOwnership))
+        self.assertTrue(runs[self.nas_model].changes == result[self.nas_model].changes)
+        self.assertTrue(runs[self.nas_model].changes.author_line_counts() ==
+                        result[self.nas_model].changes.author_line_counts())
+
     def test_find_unmerged(self):
         repo = git.Repo(TEST_REPO_UNMERGED)
         c_range = CommitRange(repo, 'HEAD', 'ROOT')